@@ -0,0 +1,149 @@
+# GPIO backend selection
+#
+# Everything that touches pins imports GPIO from here instead of RPi.GPIO:
+#
+#   from backend import GPIO
+#
+# The backend is picked with the GPIO_BACKEND environment variable:
+#   rpi  - the real RPi.GPIO module (default)
+#   sim  - an in-memory simulation, for running and profiling off the Pi
+#
+# With GPIO_TRACE=<prefix> every pin write and PWM call is also recorded
+# to <prefix>.<pid>.gtr (see gpiotrace.py).
+
+import os
+from array import array
+
+
+class SimPWM:
+
+    def __init__(self, gpio, channel, frequency):
+        self.gpio = gpio
+        self.channel = channel
+        self.frequency = frequency
+        self.duty = 0.0
+        self.running = False
+        self.updates = 0     # number of duty/frequency changes
+
+    def start(self, duty):
+        self.running = True
+        self.ChangeDutyCycle(duty)
+
+    def ChangeDutyCycle(self, duty):
+        if not 0.0 <= duty <= 100.0:
+            raise ValueError("dutycycle must have a value from 0.0 to 100.0")
+        self.duty = duty
+        self.updates += 1
+        self.gpio.duty[self.channel] = duty
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+        self.updates += 1
+
+    def stop(self):
+        self.running = False
+        self.gpio.duty[self.channel] = 0.0
+
+
+class SimGPIO:
+
+    # same constants as RPi.GPIO
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    NUM_PINS = 64
+
+    def __init__(self):
+        self.mode = None
+        self.levels = array('B', bytes(SimGPIO.NUM_PINS))    # current pin levels
+        self.dirs = array('b', [-1] * SimGPIO.NUM_PINS)      # -1 = not set up
+        self.duty = array('d', bytes(8 * SimGPIO.NUM_PINS))  # PWM duty cycles
+        self.writes = 0      # total pin writes, for benchmarks
+        self.events = {}     # channel -> [edge, callbacks, bouncetime]
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=None):
+        for c in (channel if isinstance(channel, (list, tuple)) else [channel]):
+            self.dirs[c] = direction
+            if direction == SimGPIO.OUT and initial is not None:
+                self.levels[c] = 1 if initial else 0
+            elif direction == SimGPIO.IN:
+                self.levels[c] = 1 if pull_up_down == SimGPIO.PUD_UP else 0
+
+    def output(self, channel, value):
+        levels = self.levels
+        if isinstance(channel, (list, tuple)):
+            if not isinstance(value, (list, tuple)):
+                value = [value] * len(channel)
+            for c, v in zip(channel, value):
+                levels[c] = 1 if v else 0
+            self.writes += len(channel)
+        else:
+            levels[channel] = 1 if value else 0
+            self.writes += 1
+
+    def input(self, channel):
+        return self.levels[channel]
+
+    def PWM(self, channel, frequency):
+        return SimPWM(self, channel, frequency)
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        self.events[channel] = [edge, [callback] if callback else [], bouncetime]
+
+    def add_event_callback(self, channel, callback):
+        self.events[channel][1].append(callback)
+
+    def remove_event_detect(self, channel):
+        self.events.pop(channel, None)
+
+    # Drive an input pin from test code, firing any edge callbacks:
+    def drive(self, channel, level):
+        old = self.levels[channel]
+        new = 1 if level else 0
+        self.levels[channel] = new
+        if channel in self.events and old != new:
+            edge, callbacks, _ = self.events[channel]
+            if edge == SimGPIO.BOTH or (edge == SimGPIO.RISING) == bool(new):
+                for cb in callbacks:
+                    cb(channel)
+
+    def cleanup(self, channel=None):
+        if channel is None:
+            self.__init__()
+        else:
+            for c in (channel if isinstance(channel, (list, tuple)) else [channel]):
+                self.dirs[c] = -1
+                self.levels[c] = 0
+                self.events.pop(c, None)
+
+
+def load(name):
+    if name == "sim":
+        return SimGPIO()
+    if name == "rpi":
+        import RPi.GPIO
+        return RPi.GPIO
+    raise ValueError(f"unknown GPIO backend: {name}")
+
+
+BACKEND = os.environ.get("GPIO_BACKEND", "rpi")
+GPIO = load(BACKEND)
+if os.environ.get("GPIO_TRACE"):
+    from gpiotrace import Recorder
+    GPIO = Recorder(GPIO, os.environ["GPIO_TRACE"])
@@ -0,0 +1,95 @@
+# Shift-rate benchmarks
+#
+# Reports per-call GPIO overhead, shiftByte/s, shiftFrames frames/s,
+# 8-register chain frames/s on one lane and on four, and Stepper steps/s
+# for every GPIO backend that can be loaded here:
+#
+#   python bench.py              # all backends
+#   python bench.py sim          # one backend
+#
+# Each backend runs in its own interpreter, since the backend is chosen
+# when backend.py is first imported.
+
+import os
+import sys
+import time
+import subprocess
+
+BACKENDS = ["sim", "rpi"]
+
+
+def rate(fn, n):    # calls of fn(n) per second
+    t0 = time.perf_counter()
+    fn(n)
+    return n / (time.perf_counter() - t0)
+
+
+def run():
+    from backend import GPIO, BACKEND
+    from shifter import Shifter, LaneShifter
+    from mult import Stepper
+    from profiles import Profile
+    import multiprocessing
+
+    s = Shifter(data=16, clock=20, latch=21)
+    frames = bytes(range(256)) * 40
+
+    def output(n):
+        for _ in range(n):
+            GPIO.output(16, 1)
+
+    def shiftByte(n):
+        for i in range(n):
+            s.shiftByte(i & 0xFF)
+
+    def shiftWord(n):
+        for i in range(n):
+            s.shiftWord(i & 0xFF, 8)
+
+    def shiftFrames(n):
+        s.shiftFrames(frames[:n])
+
+    chain = bytes(range(8))
+    lanes = LaneShifter([16, 5, 6, 13], clock=20, latch=21)
+
+    def chain1(n):
+        for _ in range(n):
+            s.shiftBytes(chain)
+
+    def chain4(n):
+        for _ in range(n):
+            lanes.shiftBytes(chain)
+
+    def steps(n):
+        m.rotate(n / Stepper.steps_per_degree)
+        m.wait()
+
+    Stepper.profile = Profile("constant", start_delay=0)
+    m = Stepper(s, multiprocessing.Lock())
+
+    results = [
+        ("GPIO.output overhead [us/call]", 1e6 / rate(output, 100000)),
+        ("shiftWord [bytes/s]", rate(shiftWord, 5000)),
+        ("shiftByte [bytes/s]", rate(shiftByte, 10000)),
+        ("shiftFrames [frames/s]", rate(shiftFrames, len(frames))),
+        ("chain x8, 1 lane [frames/s]", rate(chain1, 2000)),
+        ("chain x8, 4 lanes [frames/s]", rate(chain4, 2000)),
+        ("Stepper [steps/s]", rate(steps, 4096)),
+    ]
+    print(f"backend: {BACKEND}")
+    for name, value in results:
+        print(f"  {name:32s} {value:12.1f}")
+
+
+if __name__ == "__main__":
+    if os.environ.get("BENCH_CHILD"):
+        run()
+        sys.exit()
+    for name in sys.argv[1:] or BACKENDS:
+        env = dict(os.environ, GPIO_BACKEND=name, BENCH_CHILD="1")
+        p = subprocess.run([sys.executable, __file__], env=env,
+                           capture_output=True, text=True)
+        if p.returncode:
+            print(f"backend: {name} (unavailable: {p.stderr.strip().splitlines()[-1]})")
+        else:
+            print(p.stdout, end="")
@@ -1,41 +1,40 @@
-import RPi.GPIO as GPIO
-import time
-from shifter import Bug
+from backend import GPIO
+from shifter1 import Bug
+from inputs import Inputs
 
 s1 = 16
 s2 = 20
 s3 = 21
 
 GPIO.setmode(GPIO.BCM)
-GPIO.setup(s1, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-GPIO.setup(s2, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-GPIO.setup(s3, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
 
 bug = Bug()
 
-prev = GPIO.input(s2)
-active = False
+def power(pin, on):
+    if on:
+        bug.start()
+    else:
+        bug.stop()
+
+def toggleWrap(pin, on):
+    bug.isWrapOn = not bug.isWrapOn
+
+def boost(pin, on):
+    if on:
+        bug.timestep = .1/3
+    else:
+        bug.timestep = .1
+
+inputs = Inputs()
+inputs.add(s1, power)
+inputs.add(s2, toggleWrap, GPIO.RISING)
+inputs.add(s3, boost)
+if inputs.level(s1): # switches already on at startup
+    power(s1, 1)
+boost(s3, inputs.level(s3))
 
 try:
-    while True:
-        power = GPIO.input(s1)
-        toggleWrap = GPIO.input(s2)
-        boost = GPIO.input(s3)
-        if power and not active:
-            bug.start()
-            active = True
-        elif not power and active:
-            bug.stop()
-            active = False
-        if toggleWrap != prev:
-            if toggleWrap:
-                bug.isWrapOn = not bug.isWrapOn
-            prev = toggleWrap
-        if boost:
-            bug.timestep = .1/3
-        else:
-            bug.timestep = .1
-        
+    inputs.run() # callbacks run here, on switch changes only
 except KeyboardInterrupt:
     bug.stop()
 finally:
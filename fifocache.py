@@ -0,0 +1,25 @@
+# Bounded memo cache
+#
+# A dict of at most `size` entries that drops the oldest one (first
+# inserted) to make room.  For values that cost more to build than their
+# key costs to compute; lookups and inserts are single dict operations,
+# so threads can share one without a lock (at worst they both build a
+# missing entry).
+#
+#   cache = FIFOCache(16)
+#   value = cache.lookup(key, lambda: build(key))
+
+class FIFOCache(dict):
+
+    def __init__(self, size):
+        super().__init__()
+        self.size = size     # entries kept
+
+    # The entry for key, built with make() and stored if it isn't there:
+    def lookup(self, key, make):
+        entry = self.get(key)
+        if entry is None:
+            if len(self) >= self.size:
+                self.pop(next(iter(self), None), None)    # drop the oldest entry
+            entry = self[key] = make()
+        return entry
@@ -0,0 +1,61 @@
+# Aiming solutions for positions.json
+#
+# All turrets and globes sit on a circle of radius r around the arena
+# centre.  From our own turret, the azimuth to another point on the circle
+# follows from the isosceles triangle formed with the centre, and the
+# elevation to a globe from its height over the chord length.
+#
+# Solutions are computed column-wise for the whole document in one pass
+# and memoized by a hash of the raw document and our team id, so reloading
+# an unchanged positions.json costs one hash.
+
+import json
+import math
+import hashlib
+from fifocache import FIFOCache
+
+CACHE_MAX = 16
+_cache = FIFOCache(CACHE_MAX)     # content hash -> (document, targets)
+
+
+# Azimuths [deg] to points at polar angles thetas [rad], seen from our_theta [deg]:
+# (diff is the angle between us and the target around the centre; the
+# isosceles triangle gives the angle we need to turn to reach it)
+def azimuths(thetas, our_theta):
+    return [round((180 - (-(math.degrees(t) - our_theta) % 360)) / 2) for t in thetas]
+
+
+# Elevations [deg] to globes of radius rs and heights zs at azimuths azs
+# (splitting the isosceles triangle in two gives the chord length to the
+# globe, and the right triangle with its height gives the elevation):
+def elevations(rs, zs, azs):
+    return [math.degrees(math.atan(z / (2 * r * math.cos(math.radians(az)))))
+            for r, z, az in zip(rs, zs, azs)]
+
+
+# Targets [(az, el), ...] for a parsed document: every other turret at
+# zero elevation, then every globe.
+def aim(doc, team_id):
+    turrets = doc["turrets"]
+    globes = doc["globes"]
+    our_theta = math.degrees(turrets[team_id]["theta"])
+
+    others = [t for tid, t in turrets.items() if tid != team_id]
+    t_az = azimuths([t["theta"] for t in others], our_theta)
+
+    g_az = azimuths([g["theta"] for g in globes], our_theta)
+    g_el = elevations([g["r"] for g in globes], [g["z"] for g in globes], g_az)
+
+    return tuple((az, 0.0) for az in t_az) + tuple(zip(g_az, g_el))
+
+
+# Parse and solve a raw positions document (bytes), reusing earlier
+# results for identical content.  Returns (document, targets).
+def solve(raw, team_id):
+    key = hashlib.sha1(raw + b"\0" + team_id.encode()).hexdigest()
+
+    def parse():
+        doc = json.loads(raw)
+        return doc, aim(doc, team_id)
+
+    return _cache.lookup(key, parse)
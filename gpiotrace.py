@@ -0,0 +1,248 @@
+# GPIO trace recorder and replay
+#
+# With GPIO_TRACE set, backend.py wraps the GPIO backend in a Recorder that
+# logs every pin setup, pin write and PWM call into a preallocated ring
+# buffer of 8-byte events (no allocation per event).  The ring is an array
+# view straight onto a memory-mapped file, so the trace is on disk as it is
+# written and survives a crash or a multiprocessing child's os._exit;
+# flush() only syncs it:
+#
+#   GPIO_TRACE=/tmp/run python page.py     # writes /tmp/run.<pid>.gtr
+#
+# Each process writes its own file, including the motion worker forked by
+# mult.py.  Events are packed into one 64-bit word:
+#
+#   bits 63..24   time since the recorder started [us]
+#   bits 23..20   event kind (OUTPUT, SETUP, PWM_*)
+#   bits 19..14   channel (BCM)
+#   bits 13..0    value: pin level, duty cycle [0.01 %], frequency [Hz],
+#                 or direction + 2 * (initial level + 1) for SETUP
+#
+# Only the last `size` events are kept.  So that a trace whose setup has
+# long left the ring still replays, the latest setup and PWM frequency of
+# every channel are also kept in a section of their own, outside the ring.
+# Replay applies that configuration first, then feeds one or more traces,
+# merged by time, through the simulated backend, at recorded speed, faster
+# (--speed 10) or as fast as possible (--speed 0):
+#
+#   python gpiotrace.py replay /tmp/run.*.gtr [--speed N]
+#   python gpiotrace.py dump /tmp/run.1234.gtr
+
+import os
+import sys
+import time
+import mmap
+import atexit
+import struct
+import threading
+from array import array
+
+MAGIC = b"GPIOTRC2"
+HEADER = struct.Struct("<8sQQQQ")     # magic, start [monotonic ns], size, count, pid
+HEADER_SIZE = 64     # bytes before the channel configuration
+CHANNELS = 64
+# Per channel: setup value + 1 (0 = never set up), PWM frequency [Hz]
+# (0 = no PWM).  The ring follows.
+CONFIG_SIZE = 8 * 2 * CHANNELS
+RING = HEADER_SIZE + CONFIG_SIZE
+
+OUTPUT = 0
+SETUP = 1
+PWM_START = 2
+PWM_DUTY = 3
+PWM_FREQ = 4
+PWM_STOP = 5
+KINDS = ["output", "setup", "pwm_start", "pwm_duty", "pwm_freq", "pwm_stop"]
+
+
+class TracedPWM:
+
+    def __init__(self, recorder, channel, pwm):
+        self.recorder = recorder
+        self.channel = channel
+        self.pwm = pwm
+
+    def start(self, duty):
+        self.pwm.start(duty)
+        self.recorder.log(PWM_START, self.channel, round(duty * 100))
+
+    def ChangeDutyCycle(self, duty):
+        self.pwm.ChangeDutyCycle(duty)
+        self.recorder.log(PWM_DUTY, self.channel, round(duty * 100))
+
+    def ChangeFrequency(self, frequency):
+        self.pwm.ChangeFrequency(frequency)
+        self.recorder.pwm_frequency(self.channel, frequency)
+
+    def stop(self):
+        self.pwm.stop()
+        self.recorder.log(PWM_STOP, self.channel, 0)
+
+
+# Stands in for the GPIO module; anything not traced goes straight to it.
+class Recorder:
+
+    def __init__(self, gpio, prefix, size=1 << 16):
+        self.gpio = gpio
+        self.prefix = prefix     # files are <prefix>.<pid>.gtr
+        self.size = size     # ring capacity [events]
+        self.__open()
+        atexit.register(self.flush)
+        os.register_at_fork(after_in_child=self.__open)
+
+    # New ring and file for this process:
+    def __open(self):
+        self.lock = threading.Lock()     # a forked child may inherit it held
+        self.count = 0     # events logged so far
+        self.start = time.monotonic_ns()
+        self.path = f"{self.prefix}.{os.getpid()}.gtr"
+        with open(self.path, "wb+") as f:
+            f.truncate(RING + 8 * self.size)
+            self.map = mmap.mmap(f.fileno(), 0)
+        HEADER.pack_into(self.map, 0, MAGIC, self.start, self.size, 0, os.getpid())
+        view = memoryview(self.map)
+        self.header = view[:HEADER.size].cast('Q')     # [3] is the event count
+        self.config = view[HEADER_SIZE:RING].cast('Q')
+        self.ring = view[RING:].cast('Q')
+
+    def __getattr__(self, name):
+        return getattr(self.gpio, name)
+
+    def log(self, kind, channel, value):
+        t = (time.monotonic_ns() - self.start) // 1000
+        with self.lock:
+            self.ring[self.count % self.size] = t << 24 | kind << 20 | channel << 14 | value
+            self.count += 1
+            self.header[3] = self.count
+
+    def setup(self, channel, direction, *args, **kwargs):
+        self.gpio.setup(channel, direction, *args, **kwargs)
+        initial = kwargs.get("initial")
+        value = direction + 2 * (0 if initial is None else 2 if initial else 1)
+        for c in (channel if isinstance(channel, (list, tuple)) else [channel]):
+            self.config[2 * c] = value + 1
+            self.log(SETUP, c, value)
+
+    def output(self, channel, value):
+        self.gpio.output(channel, value)
+        t = (time.monotonic_ns() - self.start) // 1000 << 24    # one time for the whole call
+        ring, size = self.ring, self.size
+        with self.lock:
+            i = self.count
+            if isinstance(channel, (list, tuple)):
+                many = isinstance(value, (list, tuple))
+                for k, c in enumerate(channel):
+                    ring[i % size] = t | c << 14 | (1 if (value[k] if many else value) else 0)
+                    i += 1
+            else:
+                ring[i % size] = t | channel << 14 | (1 if value else 0)
+                i += 1
+            self.count = self.header[3] = i
+
+    def PWM(self, channel, frequency):
+        pwm = TracedPWM(self, channel, self.gpio.PWM(channel, frequency))
+        self.pwm_frequency(channel, frequency)
+        return pwm
+
+    def pwm_frequency(self, channel, frequency):
+        value = min(max(round(frequency), 1), 0x3FFF)
+        self.config[2 * channel + 1] = value
+        self.log(PWM_FREQ, channel, value)
+
+    # Push the mapped file to disk:
+    def flush(self):
+        self.map.flush()
+
+
+# Channel configuration and events of a trace file:
+# ({channel: setup value}, {channel: PWM frequency},
+#  [(time [ns], kind, channel, value)] oldest first)
+def load(path):
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        magic, start, size, count, _ = HEADER.unpack_from(m, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a GPIO trace")
+        config = array('Q', m[HEADER_SIZE:RING])
+        ring = array('Q', m[RING:RING + 8 * size])
+    setups = {c: config[2 * c] - 1 for c in range(CHANNELS) if config[2 * c]}
+    freqs = {c: config[2 * c + 1] for c in range(CHANNELS) if config[2 * c + 1]}
+    first = max(0, count - size)
+    events = []
+    for n in range(first, count):
+        e = ring[n % size]
+        events.append((start + (e >> 24) * 1000, e >> 20 & 0xF, e >> 14 & 0x3F, e & 0x3FFF))
+    return setups, freqs, events
+
+
+# Play traces into a GPIO backend (a fresh SimGPIO by default) and return it.
+# speed is a multiple of the recorded speed; 0 plays without waiting.
+def replay(paths, speed=1.0, gpio=None):
+    if gpio is None:
+        from backend import SimGPIO
+        gpio = SimGPIO()
+    traces = [load(p) for p in paths]
+    pwms = {}
+
+    def setup(channel, value):
+        initial = value >> 1
+        gpio.setup(channel, value & 1, initial=None if initial == 0 else initial - 1)
+
+    def pwm(channel):     # created lazily if its creation isn't in the trace
+        if channel not in pwms:
+            pwms[channel] = gpio.PWM(channel, 0)
+        return pwms[channel]
+
+    for setups, freqs, _ in traces:     # pin configuration to start from
+        for channel, value in setups.items():
+            setup(channel, value)
+        for channel, frequency in freqs.items():
+            pwm(channel).ChangeFrequency(frequency)
+    events = sorted((e for _, _, ev in traces for e in ev), key=lambda e: e[0])
+    t0 = events[0][0] if events else 0
+    wall0 = time.monotonic_ns()
+    for t, kind, channel, value in events:
+        if speed:
+            wait = (wall0 + (t - t0) / speed - time.monotonic_ns()) / 1e9
+            if wait > 0:
+                time.sleep(wait)
+        if kind == OUTPUT:
+            gpio.output(channel, value)
+        elif kind == SETUP:
+            setup(channel, value)
+        elif kind == PWM_FREQ:
+            pwm(channel).ChangeFrequency(value)
+        elif kind == PWM_START:
+            pwm(channel).start(value / 100)
+        elif kind == PWM_DUTY:
+            pwm(channel).ChangeDutyCycle(value / 100)
+        elif kind == PWM_STOP:
+            pwm(channel).stop()
+    return gpio
+
+
+if __name__ == "__main__":
+    os.environ["GPIO_BACKEND"] = "sim"
+    os.environ.pop("GPIO_TRACE", None)
+    args = sys.argv[1:]
+    speed = 1.0
+    if "--speed" in args:
+        k = args.index("--speed")
+        speed = float(args[k + 1])
+        del args[k:k + 2]
+    if len(args) < 2 or args[0] not in ("replay", "dump"):
+        sys.exit("usage: gpiotrace.py replay|dump FILE... [--speed N]")
+    if args[0] == "dump":
+        for path in args[1:]:
+            setups, freqs, events = load(path)
+            for channel, value in sorted(setups.items()):
+                print(f"{'config':>15s}  {'setup':9s} {channel:2d} {value}")
+            for channel, frequency in sorted(freqs.items()):
+                print(f"{'config':>15s}  {'pwm_freq':9s} {channel:2d} {frequency}")
+            t0 = events[0][0] if events else 0
+            for t, kind, channel, value in events:
+                print(f"{(t - t0) / 1e6:12.3f} ms  {KINDS[kind]:9s} {channel:2d} {value}")
+    else:
+        t = time.perf_counter()
+        gpio = replay(args[1:], speed)
+        print(f"replayed {gpio.writes} pin writes in {time.perf_counter() - t:.3f} s")
+        print("levels:", "".join(str(b) for b in gpio.levels[:32]))
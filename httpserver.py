@@ -0,0 +1,124 @@
+# Small event-driven HTTP/1.1 server
+#
+# One asyncio loop accepts and reads every connection, so a slow client
+# never holds up the others.  Requests are read in full (headers, then the
+# body by Content-Length) and connections are kept alive between requests.
+#
+# Handlers take a Request and return (status, headers, body).  Plain
+# functions run on a thread pool, so blocking work (motor waits, network
+# fetches) stays off the loop; coroutine functions run on the loop itself.
+# A body can also be an async iterator of byte chunks, which is streamed
+# until it ends or the client goes away (e.g. Server-Sent Events).
+#
+#   server = HTTPServer(handler, port=80)
+#   server.route("/api", api_handler)
+#   server.serve_forever()
+
+import asyncio
+import http
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+MAX_HEADER = 16384     # [bytes]
+MAX_BODY = 1 << 20     # [bytes]
+
+
+class Request:
+
+    def __init__(self, head):
+        lines = head.decode("latin-1").split("\r\n")
+        self.method, target, self.version = lines[0].split(" ", 2)
+        self.path, _, self.query = target.partition("?")
+        self.headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                self.headers[k.strip().lower()] = v.strip()
+        self.body = b""
+
+    # Keep the connection open after this request?
+    def keep_alive(self):
+        conn = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return conn == "keep-alive"
+        return conn != "close"
+
+    # Form fields from the query string and a urlencoded body:
+    def form(self):
+        fields = dict(parse_qsl(self.query))
+        fields.update(parse_qsl(self.body.decode("utf-8", "replace")))
+        return fields
+
+
+class HTTPServer:
+
+    def __init__(self, handler, port=80, workers=8, timeout=30):
+        self.default = handler     # handler for any path without a route
+        self.routes = {}     # path -> handler
+        self.port = port
+        self.timeout = timeout     # idle keep-alive timeout [s]
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def route(self, path, handler):
+        self.routes[path] = handler
+
+    def serve_forever(self):
+        asyncio.run(self.__serve())
+
+    async def __serve(self):
+        server = await asyncio.start_server(self.__client, "", self.port,
+                                            limit=MAX_HEADER)
+        async with server:
+            await server.serve_forever()
+
+    @staticmethod
+    def head(status, headers, length, keep):
+        lines = [f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        lines.append("Connection: " + ("keep-alive" if keep else "close"))
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def __handle(self, req):
+        handler = self.routes.get(req.path, self.default)
+        try:
+            if asyncio.iscoroutinefunction(handler):
+                return await handler(req)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, handler, req)
+        except Exception as e:
+            return 500, {"Content-Type": "text/plain"}, f"Error: {e}".encode()
+
+    async def __client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.timeout)
+                    req = Request(head)
+                    length = int(req.headers.get("content-length", 0))
+                    if not 0 <= length <= MAX_BODY:
+                        raise ValueError("bad Content-Length")
+                    req.body = await reader.readexactly(length)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except (asyncio.LimitOverrunError, ValueError):
+                    writer.write(self.head(400, {}, 0, False))
+                    break
+                status, headers, body = await self.__handle(req)
+                if not isinstance(body, bytes):     # streamed response
+                    writer.write(self.head(status, headers, None, False))
+                    async for chunk in body:
+                        writer.write(chunk)
+                        await writer.drain()
+                    break
+                keep = req.keep_alive()
+                length = None if status in (204, 304) else len(body)
+                writer.write(self.head(status, headers, length, keep) + body)
+                await writer.drain()
+                if not keep:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
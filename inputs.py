@@ -0,0 +1,110 @@
+# Debounced switch inputs
+#
+# Watches input pins with GPIO edge detection and reports settled level
+# changes to callbacks, callback(pin, level).  An edge only (re)starts a
+# settle timer; once the pin has been quiet for `debounce` seconds it is
+# read again, and the callback runs only if that level differs from the
+# last one reported.  Nothing runs between edges, so idle switches cost no
+# CPU.  Pins where edge detection isn't available (or every pin, with
+# edges=False) are polled at poll_hz instead, through the same debouncer.
+#
+# Callbacks all run on the manager's thread, one at a time, so they can
+# share state without locks.
+#
+#   inputs = Inputs()
+#   inputs.add(16, on_power)                 # every settled change
+#   inputs.add(20, on_button, GPIO.RISING)   # presses only
+#   inputs.start()     # or inputs.run() to block in this thread
+
+import time
+import threading
+from backend import GPIO
+
+
+class Inputs:
+
+    def __init__(self, debounce=0.02, poll_hz=100, edges=True):
+        self.debounce = debounce     # quiet time before a change counts [s]
+        self.poll_hz = poll_hz     # rate for polled pins [Hz]
+        self.edges = edges     # use edge detection where the pin supports it
+        self.pins = {}     # pin -> [callback, edge, reported level, polled]
+        self.settle = {}     # pin -> when its pending change settles [monotonic s]
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def add(self, pin, callback, edge=GPIO.BOTH, pull=GPIO.PUD_DOWN):
+        GPIO.setup(pin, GPIO.IN, pull_up_down=pull)
+        polled = not self.edges
+        if not polled:
+            try:
+                GPIO.add_event_detect(pin, GPIO.BOTH, callback=self.__edge)
+            except RuntimeError:
+                polled = True     # no edge detection on this pin: poll it
+        with self.cond:
+            self.pins[pin] = [callback, edge, GPIO.input(pin), polled]
+            self.cond.notify()
+
+    def remove(self, pin):
+        with self.cond:
+            if not self.pins.pop(pin)[3]:
+                GPIO.remove_event_detect(pin)
+            self.settle.pop(pin, None)
+
+    # Last reported (debounced) level of a pin:
+    def level(self, pin):
+        return self.pins[pin][2]
+
+    # GPIO edge callback: wait for the pin to settle
+    def __edge(self, pin):
+        with self.cond:
+            self.settle[pin] = time.monotonic() + self.debounce
+            self.cond.notify()
+
+    def __loop(self):
+        period = 1 / self.poll_hz
+        next_poll = time.monotonic()
+        while self.running:
+            changes = []
+            with self.cond:
+                now = time.monotonic()
+                polled = any(p[3] for p in self.pins.values())
+                if polled and now >= next_poll:
+                    for pin, p in self.pins.items():
+                        if p[3] and pin not in self.settle and GPIO.input(pin) != p[2]:
+                            self.settle[pin] = now + self.debounce
+                    next_poll = max(next_poll + period, now)
+                for pin in [pin for pin, t in self.settle.items() if t <= now]:
+                    del self.settle[pin]
+                    p = self.pins[pin]
+                    level = GPIO.input(pin)
+                    if level != p[2]:
+                        p[2] = level
+                        if p[1] == GPIO.BOTH or (p[1] == GPIO.RISING) == bool(level):
+                            changes.append((p[0], pin, level))
+                if not changes:
+                    wake = min(self.settle.values(), default=None)
+                    if polled:
+                        wake = next_poll if wake is None else min(wake, next_poll)
+                    self.cond.wait(None if wake is None else wake - now)
+            for callback, pin, level in changes:
+                callback(pin, level)
+
+    # Dispatch changes in this thread until stop():
+    def run(self):
+        self.running = True
+        self.__loop()
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self.__loop, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
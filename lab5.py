@@ -1,29 +1,24 @@
-import RPi.GPIO as GPIO
-import math
-import time
+from backend import GPIO
+from pwmwave import Wave
+from inputs import Inputs
 # callback pin is 21
 button=21
 p = [4,17,27,22,10,9,11,19,26,13] # gpio pins
+FPS = 50 # frames per second
 GPIO.setmode(GPIO.BCM)
-GPIO.setup(button, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
 GPIO.setup(p, GPIO.OUT)
 pwms = [GPIO.PWM(i, 500) for i in p]
-control=1
-def myCallback(pin):
+wave = Wave(pwms, freq=0.2, fps=FPS) # f=0.2 hz
+def myCallback(pin, level):
     print("Direction flipped")
-    global control
-    control *= -1
-GPIO.add_event_detect(button, GPIO.RISING, callback=myCallback, bouncetime=300)
+    wave.flip() # applied at the next frame
+inputs = Inputs(debounce=0.05)
+inputs.add(button, myCallback, GPIO.RISING)
+inputs.start()
 try:
     for pwm in pwms:
         pwm.start(0) # start pwm with 0% duty cycle
-    while True:
-        t = time.time()
-        f=0.2 # hz
-        for i, pwm in enumerate(pwms):
-            phi = control * i * (math.pi / 11)
-            B = (math.sin(2 * math.pi * f * t - phi)) ** 2
-            pwm.ChangeDutyCycle(B * 100)
+    wave.run()
 except KeyboardInterrupt:
     for pwm in pwms:
         try:
@@ -31,5 +26,3 @@ except KeyboardInterrupt:
         except:
             pass
     GPIO.cleanup()
-
-
@@ -0,0 +1,106 @@
+# Web server shared by the lab7 LED brightness pages
+#
+# GET / renders the page; a form POST to / (lab7p1) sets one LED and
+# renders the page again.  Sliders (lab7p2) POST to /led instead, which
+# only records the value and answers 204 with no page.
+#
+# Updates are latest-value-wins per LED: a request just stores the newest
+# brightness and wakes the applier thread, which pushes whatever is newest
+# to the PWM, so a burst of slider events costs one ChangeDutyCycle per
+# LED instead of one per request.  Slider requests carry a client id and
+# a sequence number, so one that arrives late on another connection can't
+# overwrite a newer value.
+#
+#   server = LEDServer(PAGE)     # PAGE: Template with slots {0} {1} {2}
+#   server.serve_forever()
+
+import threading
+from backend import GPIO as gpio
+from httpserver import HTTPServer
+
+PINS = {
+    "led1": 14,
+    "led2": 15,
+    "led3": 18
+}
+
+
+class LEDServer:
+
+    def __init__(self, page, pins=PINS, port=80, freq=500):
+        self.page = page     # Template, one slot per LED in pins order
+        gpio.setmode(gpio.BCM)
+        for pin in pins.values():
+            gpio.setup(pin, gpio.OUT)
+        self.pwms = {led: gpio.PWM(pin, freq) for led, pin in pins.items()}
+        for pwm in self.pwms.values():
+            pwm.start(0)
+        self.brightness = {led: 0 for led in pins}     # newest requested [%]
+        self.applied = dict(self.brightness)     # last sent to the PWM [%]
+        self.last = {}     # led -> (client, seq) of the newest slider update
+        self.cond = threading.Condition()
+        self.server = HTTPServer(self.handle, port=port)
+        self.server.route("/led", self.update)
+
+    # Record a new brightness; False if it is older than one already seen.
+    def set(self, led, value, client=None, seq=None):
+        if led not in self.brightness:
+            raise ValueError(f"unknown LED: {led}")
+        value = max(0, min(100, value))
+        with self.cond:
+            if seq is not None:
+                last = self.last.get(led)
+                if last is not None and last[0] == client and seq <= last[1]:
+                    return False     # stale, arrived out of order
+                self.last[led] = (client, seq)
+            self.brightness[led] = value
+            self.cond.notify()
+        return True
+
+    def __apply(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.brightness != self.applied)
+                changes = {led: v for led, v in self.brightness.items() if v != self.applied[led]}
+                self.applied.update(changes)
+            for led, value in changes.items():
+                self.pwms[led].ChangeDutyCycle(value)
+
+    @staticmethod
+    def __int(value, default=0):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return default
+
+    def web_page(self):
+        return self.page.render(*self.brightness.values())
+
+    def handle(self, req):
+        if req.method == "POST":
+            data = req.form()
+            if data.get("led") in self.brightness:
+                self.set(data["led"], self.__int(data.get("brightness")))
+        return self.page.respond(req.headers, *self.brightness.values())
+
+    # Lightweight slider endpoint: led, brightness, client, seq
+    def update(self, req):
+        data = req.form()
+        try:
+            self.set(data.get("led"), self.__int(data.get("brightness")),
+                     data.get("client"), self.__int(data.get("seq"), None))
+        except ValueError as e:
+            return 400, {"Content-Type": "text/plain"}, str(e).encode()
+        return 204, {}, b""
+
+    def serve_forever(self):
+        threading.Thread(target=self.__apply, daemon=True).start()
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print("Shutting down...")
+            for pwm in self.pwms.values():
+                pwm.stop()
+            gpio.cleanup()
@@ -1,99 +1,466 @@
-import time
 import multiprocessing
-from shifter import Shifter   # Shifter class
-import RPi.GPIO as gpio
+import queue
+from shifter import Shifter, Chain   # Shifter class, register chain
+from profiles import Profile
+from steptimer import StepTimer
+from sharedstate import StateBlock
+from backend import GPIO as gpio
 
 gpio.setmode(gpio.BCM)
 LED_PIN = 17
 gpio.setup(LED_PIN, gpio.OUT)
 gpio.output(LED_PIN, 0)
 
-led_state = multiprocessing.Value('i', 0)
+MAX_MOTORS = 16
+shared = StateBlock(MAX_MOTORS)     # motor positions/targets, shifter image, laser
 
 def led_on():
-    with led_state.get_lock():
-        led_state.value = 1
+    shared.set_laser(1)
     gpio.output(LED_PIN, 1)
 
 def led_off():
-    with led_state.get_lock():
-        led_state.value = 0
+    shared.set_laser(0)
     gpio.output(LED_PIN, 0)
 
 
+# One motor's part in a move, as tracked by the motion worker
+class Move:
+
+    def __init__(self, dir, steps, ticks, delays, lead, double, tag, offset, end, single):
+        self.dir = dir     # +1 or -1
+        self.steps = steps     # motor steps in the move
+        self.ticks = ticks     # ticks in the move (same for a whole coordinated move)
+        self.err = ticks // 2     # Bresenham error term
+        self.left = ticks     # ticks still to go
+        self.delays = delays     # step delays from the acceleration profile [us]
+        self.taken = 0     # motor steps taken so far
+        self.lead = lead     # leading half steps
+        self.double = double     # double steps (full/wave mode)
+        self.tag = tag     # abort count when the move was queued
+        self.offset = offset     # profile ticks skipped when joining at speed
+        self.end = end     # unwrapped end position [half steps]
+        self.single = single     # only motor in its move, so it can blend or reverse
+        self.stopping = False     # already ramping down
+
+    # Index into delays of the next tick:
+    def tick_index(self):
+        return self.offset + self.ticks - self.left
+
+    def delay(self):
+        return self.delays[self.tick_index()]
+
+    # Stop as soon as the profile allows.  The schedule's tail is the
+    # mirror of its ramp-up, so skip ahead to the part of the tail that
+    # starts one step slower than the current speed: as many ticks as the
+    # ramp-up took to get this fast (never more than the ramp, however
+    # long the move has been cruising, and no more than it has ramped so
+    # far while still speeding up).
+    def ramp_down(self):
+        if self.stopping:
+            return
+        self.stopping = True
+        delays = self.delays
+        d = self.delay()
+        r = 0
+        while r < self.left and r < len(delays) // 2 and delays[r] > d:
+            r += 1
+        self.left = min(self.left, r)
+
+
 class Stepper:
 
     num_steppers = 0
-    shifter_outputs = multiprocessing.Value('i', 0)
-    shifter_lock = multiprocessing.Lock()
+    steppers = []     # every motor, in shifter bit order
     seq = [0b0001,0b0011,0b0010,0b0110,0b0100,0b1100,0b1000,0b1001]  # CCW sequence
-    delay = 1200     # delay between motor steps [us]
-    steps_per_degree = 4096 / 360      # 64:1 stepper
+    # drive modes: (entries of seq used, or None for all; seq entries per step)
+    #   half - alternate one and two coils, 8 steps per cycle
+    #   full - two coils at a time, 4 steps per cycle, more torque
+    #   wave - one coil at a time, 4 steps per cycle, least current
+    # Positions are always counted in half steps, so full/wave steps count 2.
+    modes = {"half": (None, 1), "full": (1, 2), "wave": (0, 2)}
+    delay = 1200     # delay between motor steps from rest [us]
+    profile = Profile("trapezoid", start_delay=delay)     # default acceleration profile
+    steps_per_rev = 4096      # 64:1 stepper
+    steps_per_degree = steps_per_rev / 360
+    commands = multiprocessing.Queue()     # moves for the motion worker
+    worker = None     # one motion process drives all motors
+    timer = StepTimer()     # step clock, with per-step latency stats
+    # Orders commands and aborts, and makes issuing a command (count it,
+    # clear done) atomic with the worker's idle check (compare counts, set
+    # done), so done can't be set over a command that was just issued:
+    submit_lock = multiprocessing.Lock()
 
-    def __init__(self, shifter, lock):
+    def __init__(self, shifter, lock=None, mode="half"):
+        if Stepper.num_steppers >= MAX_MOTORS:
+            raise ValueError(f"at most {MAX_MOTORS} motors")
+        if mode not in Stepper.modes:
+            raise ValueError(f"unknown drive mode: {mode}")
+        self.mode = mode     # default drive mode for this motor's moves
         self.s = shifter     # shift register
-        self.angle = multiprocessing.Value('d', 0.0) 
         self.step_state = 0     # track position in sequence
         self.shifter_bit_start = 4 * Stepper.num_steppers # starting bit position
-        self.lock = lock     # multiprocessing lock
-        self.active = None      # track current motor process
+        self.device, self.lsb = divmod(self.shifter_bit_start, 8)   # register in the chain, bit in it
+        self.lock = lock     # unused: the motion worker serializes moves
+        self.index = Stepper.num_steppers
+        self.done = multiprocessing.Event()     # set while the motor is idle
+        self.done.set()
         Stepper.num_steppers += 1     # increment the instance count
+        Stepper.steppers.append(self)
+
+    # (Re)start the motion worker so it knows about every motor:
+    @staticmethod
+    def start():
+        w = Stepper.worker
+        if w is not None and w.is_alive():
+            if w.num_motors == Stepper.num_steppers:
+                return
+            Stepper.close()
+        w = multiprocessing.Process(target=Stepper.__run,
+                                    args=(Stepper.steppers, Stepper.commands, Stepper.timer,
+                                          Stepper.submit_lock,
+                                          [shared.issued(i) for i in range(Stepper.num_steppers)]),
+                                    daemon=True)
+        w.num_motors = Stepper.num_steppers
+        w.start()
+        Stepper.worker = w
+
+    # Shut down the motion worker once it has finished the moves it has
+    # taken, so every command issued so far settles its motors' done:
+    @staticmethod
+    def close():
+        if Stepper.worker is not None:
+            Stepper.commands.put(None)
+            Stepper.worker.join()
+            Stepper.worker = None
+
+    # Motion worker.  Every tick it advances all moving motors on a shared
+    # timeline and shifts the combined frame once.  A coordinated move is a
+    # list of (motor index, steps) that start together; within it every
+    # motor is stepped Bresenham-style so they all finish on the same tick.
+    # The tick period comes from each move's acceleration profile; when
+    # moves overlap the slowest current delay wins, so no motor outruns its
+    # ramp.  Ticks are paced by absolute deadlines, so time spent stepping
+    # and shifting does not stretch the move.  The worker is the only writer
+    # of the motor fields in the shared state block, and publishes them once
+    # per tick.  Positions are integer step counts; angles are only worked
+    # out when someone reads them.
+    #
+    # Single-motor commands (jog/goto) go through a per-motor queue slot
+    # that always holds just the latest destination: jogs add up, a goto
+    # replaces whatever was pending.  If the motor is already moving the
+    # same way, the running move is re-planned to the new destination from
+    # its current speed, with no stop in between; if it has to reverse, it
+    # ramps down first.
+    #
+    # Every tick also checks the abort counter in the state block.  When it
+    # changes, all moves stop at once (or ramp down along their profile
+    # when decelerating), and moves queued before the abort are dropped.
+    #
+    # In full/wave mode a move first takes one half step if the motor sits
+    # on the other kind of seq entry, and ends with one half step if the
+    # distance is odd, so positions stay exact across mode changes.
+    @staticmethod
+    def __run(steppers, commands, timer, submit_lock, consumed):
+        chain = Chain(steppers[0].s, Chain.size(4 * len(steppers)))
+        for i, st in enumerate(steppers):     # pick up the coils where the last worker left them
+            coils = shared.coils(i)
+            if coils in Stepper.seq:
+                st.step_state = Stepper.seq.index(coils)
+            chain.set(st.device, st.lsb, 4, coils)
+        rev = Stepper.steps_per_rev
+        pos = [int(shared.position(i)) for i in range(len(steppers))]     # unwrapped [half steps]
+        aborts = shared.aborts()
+        # consumed: commands taken per motor, counted from the worker start
+        moves = {}     # motor index -> Move
+        pending = {}     # motor index -> [end position, mode, profile, tag]
+        deferred = []     # coordinated moves waiting for their motors: (group, profile, tag)
+        closing = False     # told to exit: take no more commands, finish the rest
+
+        def busy(i):
+            return i in moves or i in pending or any(i == j for g, _, _ in deferred for j, _, _ in g)
+
+        def settle(i):     # report idle once nothing is left for motor i
+            if not busy(i):
+                with submit_lock:
+                    if consumed[i] == shared.issued(i):
+                        steppers[i].done.set()
+
+        # Start a move, group = [(motor index, half steps, mode), ...].  With
+        # speed (a step delay) the profile is joined part-way up its ramp.
+        def begin(group, profile, tag, speed=None):
+            plans = [Stepper.__plan(abs(n), steppers[i].step_state, mode) for i, n, mode in group]
+            ticks = max(p[0] for p in plans)
+            offset = 0
+            if speed is not None:
+                ramp = profile.delays(2 * ticks + 2)
+                while offset < ticks and ramp[offset] > speed:
+                    offset += 1
+            delays = profile.delays(offset + ticks)
+            shared.begin()
+            for (i, n, _), (steps, lead, double) in zip(group, plans):
+                shared.set_target(i, (pos[i] + n) % rev)
+                if n:
+                    moves[i] = Move(1 if n > 0 else -1, steps, ticks, delays, lead, double,
+                                    tag, offset, pos[i] + n, len(group) == 1)
+            shared.end()
+            for i, n, _ in group:
+                if n == 0:
+                    settle(i)
+
+        while True:
+            idle = not moves
+            while not closing:     # pick up new commands, blocking only when idle
+                try:
+                    cmd = commands.get(block=not (moves or pending or deferred))
+                except queue.Empty:
+                    break
+                if cmd is None:
+                    closing = True
+                    break
+                kind, tag = cmd[0], cmd[-1]
+                if kind == "zero":
+                    i = cmd[1]
+                    consumed[i] += 1
+                    pos[i] = 0
+                    shared.begin()
+                    shared.set_position(i, 0)
+                    shared.set_target(i, 0)
+                    shared.end()
+                    settle(i)
+                elif kind == "move":
+                    _, group, profile, _ = cmd
+                    for i, _, _ in group:
+                        consumed[i] += 1
+                    if tag >= shared.aborts():     # else queued before a stop
+                        deferred.append((group, profile, tag))
+                    for i, _, _ in group:
+                        settle(i)
+                else:     # "jog" by some half steps or "goto" a position
+                    _, i, value, mode, profile, _ = cmd
+                    consumed[i] += 1
+                    if tag < shared.aborts():
+                        settle(i)
+                        continue
+                    if i in pending:
+                        end = pending[i][0]
+                    elif i in moves:
+                        end = moves[i].end
+                    else:
+                        end = pos[i]
+                    if kind == "jog":
+                        target = end + value
+                    else:
+                        delta = (value - end) % rev
+                        if delta > rev // 2:    # if going more than 180deg, go the other way
+                            delta -= rev
+                        target = end + delta
+                    pending[i] = [target, mode, profile, tag]
+            if closing and not (moves or pending or deferred):
+                return
+
+            if shared.aborts() != aborts:
+                aborts = shared.aborts()
+                dropped = [i for i, p in pending.items() if p[3] < aborts]
+                for i in dropped:
+                    del pending[i]
+                for g in [g for g in deferred if g[2] < aborts]:
+                    deferred.remove(g)
+                    dropped += [i for i, _, _ in g[0]]
+                shared.begin()
+                for i, m in moves.items():
+                    if m.tag >= aborts:     # queued after the stop
+                        continue
+                    if shared.abort_mode():
+                        m.ramp_down()
+                    else:
+                        m.left = 0
+                    if m.left == 0:
+                        shared.set_target(i, pos[i] % rev)
+                shared.end()
+                for i in [i for i, m in moves.items() if m.left == 0]:
+                    del moves[i]
+                    dropped.append(i)
+                for i in dropped:
+                    settle(i)
+
+            for g in list(deferred):     # coordinated moves whose motors are free
+                if not any(i in moves or i in pending for i, _, _ in g[0]):
+                    deferred.remove(g)
+                    begin(*g)
+            for i in list(pending):
+                target, mode, profile, tag = pending[i]
+                n = target - pos[i]
+                m = moves.get(i)
+                if m is None:
+                    del pending[i]
+                    begin([(i, n, mode)], profile, tag)
+                elif m.single and n and (n > 0) == (m.dir > 0):     # same way: blend
+                    del pending[i]
+                    begin([(i, n, mode)], profile, tag, m.delay())
+                elif m.single:     # reversing: ramp down first
+                    m.ramp_down()
+                    if m.left == 0:     # slow enough to turn round now
+                        del moves[i], pending[i]
+                        begin([(i, n, mode)], profile, tag)
+            if not moves:
+                continue
+            if idle:
+                timer.reset()     # new timeline starting now
+
+            finished = []
+            delay = 0
+            shared.begin()
+            for i, m in moves.items():
+                delay = max(delay, m.delay())
+                m.err += m.steps
+                if m.err >= m.ticks:     # this motor steps on this tick
+                    m.err -= m.ticks
+                    k = m.taken - m.lead
+                    d = m.dir * (2 if 0 <= k < m.double else 1)    # half or double step
+                    m.taken += 1
+                    st = steppers[i]
+                    st.step_state = (st.step_state + d) % 8
+                    chain.set(st.device, st.lsb, 4, Stepper.seq[st.step_state])
+                    shared.set_coils(i, Stepper.seq[st.step_state])
+                    pos[i] += d
+                    shared.set_position(i, pos[i] % rev)
+                m.left -= 1
+                if m.left == 0:
+                    finished.append(i)
+                    shared.set_target(i, pos[i] % rev)     # where it really ended
 
-    def __sgn(self, x):
-        if x == 0:
-            return 0
-        return int(abs(x) / x)
-        
-    # Move a single +/-1 step in the motor sequence:
-    def __step(self, dir, angle):
-        self.step_state += dir    # increment/decrement the step
-        self.step_state %= 8    # ensure result stays in [0,7]
-        mask = ~(0b1111 << self.shifter_bit_start)    # erase motor bits
-        command = Stepper.seq[self.step_state] << self.shifter_bit_start    #  motor command
-
-        with Stepper.shifter_lock:
-            Stepper.shifter_outputs.value = (Stepper.shifter_outputs.value & mask) | command     # replace old command with new command
-            self.s.shiftByte(Stepper.shifter_outputs.value)
-
-        angle.value += dir / Stepper.steps_per_degree
-        angle.value %= 360
-
-        # Move relative angle from current position:
-    def __rotate(self, delta, angle):
-        with self.lock:     # wait until lock is available
-            numSteps = int(Stepper.steps_per_degree * abs(delta))    # find the right # of steps
-            dir = self.__sgn(delta)    # find the direction (+/-1)
-            for _ in range(numSteps):    # take the steps
-                self.__step(dir, angle)
-                time.sleep(Stepper.delay / 1e6)
-                
-        # Move relative angle from current position:
-    def rotate(self, delta):
-        # wait for previous move of this motor only
-        if self.active is not None and self.active.is_alive():
-            self.active.join()
-
-        p = multiprocessing.Process(target=self.__rotate, args=(delta, self.angle))
-        p.start()
-        self.active = p
-
-        # Move to an absolute angle taking the shortest possible path:
-    def goAngle(self, angle):
-        delta = angle - self.angle.value
-        if delta > 180:    # if going more than 180deg, go the other way
-            delta -= 360
-        elif delta < -180:
-            delta += 360
-        self.rotate(delta)
+            shared.end()
+            chain.flush()     # one frame for all motors, if any coil changed
+            timer.wait(delay)
+            for i in finished:
+                del moves[i]
+                settle(i)
+
+    # Split a move of n half steps into motor steps for a drive mode.
+    # Returns (steps, leading half steps, double steps):
+    @staticmethod
+    def __plan(n, step_state, mode):
+        parity, stride = Stepper.modes[mode]
+        if stride == 1 or n == 0:
+            return n, 0, 0
+        lead = 1 if step_state % 2 != parity else 0
+        double = (n - lead) // 2
+        return lead + double + (n - lead) % 2, lead, double
+
+    # Number of steps for a relative move:
+    @staticmethod
+    def __steps(delta):
+        n = int(Stepper.steps_per_degree * abs(delta))    # find the right # of steps
+        return n if delta >= 0 else -n
+
+    # Shortest relative move from the current position to an absolute
+    # angle, in whole steps:
+    def __delta(self, angle):
+        rev = Stepper.steps_per_rev
+        delta = (round(angle * Stepper.steps_per_degree) - self.getSteps()) % rev
+        if delta > rev // 2:    # if going more than 180deg, go the other way
+            delta -= rev
+        return delta
+
+    @staticmethod
+    def __check(mode):
+        if mode is not None and mode not in Stepper.modes:
+            raise ValueError(f"unknown drive mode: {mode}")
+
+    # Send a command to the worker.  Each command counts against its
+    # motors' done events and carries the abort count it was issued under.
+    @staticmethod
+    def __submit(cmd, motors):
+        Stepper.start()
+        with Stepper.submit_lock:
+            for m in motors:
+                shared.issue(m.index)
+                m.done.clear()
+            Stepper.commands.put(cmd + (shared.aborts(),))
+
+    # Queue a coordinated move of whole (half) steps,
+    # moves = [(stepper, steps), ...].  mode overrides each motor's own
+    # drive mode for this move.
+    @staticmethod
+    def __move(moves, profile, mode):
+        Stepper.__check(mode)
+        for m, _ in moves:
+            m.wait()    # wait for previous move of these motors only
+        Stepper.__submit(("move", [(m.index, n, mode or m.mode) for m, n in moves],
+                          profile or Stepper.profile), [m for m, _ in moves])
+
+        # Move several motors by relative angles, finishing together:
+    @staticmethod
+    def rotateAll(moves, profile=None, mode=None):    # moves = [(stepper, delta), ...]
+        Stepper.__move([(m, Stepper.__steps(d)) for m, d in moves], profile, mode)
+
+        # Move several motors to absolute angles, finishing together:
+    @staticmethod
+    def goAngles(targets, profile=None, mode=None):    # targets = [(stepper, angle), ...]
+        for m, _ in targets:
+            m.wait()    # start from where the previous move ends
+        Stepper.__move([(m, m.__delta(a)) for m, a in targets], profile, mode)
+
+        # Move relative angle from where the motor is headed.  Returns at
+        # once; jogs issued while moving are merged into one move.
+    def rotate(self, delta, profile=None, mode=None):
+        Stepper.__check(mode)
+        Stepper.__submit(("jog", self.index, Stepper.__steps(delta), mode or self.mode,
+                          profile or Stepper.profile), [self])
+
+        # Move to an absolute angle taking the shortest possible path.
+        # Returns at once; a newer goAngle replaces one still pending.
+    def goAngle(self, angle, profile=None, mode=None):
+        Stepper.__check(mode)
+        target = round(angle * Stepper.steps_per_degree) % Stepper.steps_per_rev
+        Stepper.__submit(("goto", self.index, target, mode or self.mode,
+                          profile or Stepper.profile), [self])
 
         # Set the motor zero point
     def zero(self):
-        self.angle.value = 0
+        self.wait()
+        Stepper.__submit(("zero", self.index), [self])
+        self.wait()
+
+    # Motor steps per degree in a drive mode (a full/wave step is two
+    # half steps), for timing moves in that mode:
+    @staticmethod
+    def stepsPerDegree(mode):
+        return Stepper.steps_per_degree / Stepper.modes[mode][1]
+
+    # angle [deg] of a position in steps
+    @staticmethod
+    def toAngle(steps):
+        return steps * 360 / Stepper.steps_per_rev
+
+    # current position [steps from zero]
+    def getSteps(self):
+        return int(shared.position(self.index))
+
+    # current angle [deg]
+    def getAngle(self):
+        return Stepper.toAngle(shared.position(self.index))
+
+    # angle the current (or last) move ends at [deg]
+    def getTarget(self):
+        return Stepper.toAngle(shared.target(self.index))
 
     # wait until current movement is finished
     def wait(self):
-        if self.active is not None:
-            self.active.join()
+        self.done.wait()
+
+    # Stop every motor within one step period, or ramp down first when
+    # decelerate is set.  Positions afterwards are where the motors stopped.
+    @staticmethod
+    def stop(decelerate=False):
+        with Stepper.submit_lock:
+            shared.request_abort(decelerate)
+
+    # Achieved step rate and lateness histogram since the motors last
+    # started from idle:
+    @staticmethod
+    def stats():
+        return Stepper.timer.stats()
 
 
 
@@ -116,8 +483,7 @@ if __name__ == '__main__':
     m1.wait()
     m2.wait()
 
-    m1.goAngle(-45)
-    m2.goAngle(45)
+    Stepper.goAngles([(m1, -45), (m2, 45)])  # both finish together
     m1.wait()
     m2.wait()
 
@@ -129,8 +495,8 @@ if __name__ == '__main__':
     m1.wait()
 
     print("Final angles:")
-    print("Motor 1:", m1.angle.value)
-    print("Motor 2:", m2.angle.value)
+    print("Motor 1:", m1.getAngle())
+    print("Motor 2:", m2.getAngle())
 
     try:
         while True:
@@ -1,13 +1,17 @@
-import socket
+import asyncio
 import threading
-import requests
 import json
+import math
 import multiprocessing
 import time
-import math
 
-from mult import Stepper, led_on, led_off, led_state
+from mult import Stepper, led_on, led_off, shared
 from shifter import Shifter
+from planner import plan
+from geometry import solve
+from httpserver import HTTPServer
+from positions import PositionsClient
+from template import Template
 
 data = 16
 clock = 20
@@ -22,17 +26,27 @@ m2 = Stepper(shifter, lock2)    # elevation
 
 TEAM_ID = "19"
 POSITIONS_URL = "http://192.168.1.254:8000/positions.json"
+# for offline testing run positions_server.py and use
+# POSITIONS_URL = "http://localhost:8000/positions.json"
+POSITIONS_REFRESH = 5 # background refresh period [s]
+SLEW_MODE = "full" # drive mode for moves between targets (see Stepper.modes)
+STOP_DECELERATE = False # ramp down on STOP instead of halting on the next step
 
 
 loaded_targets = []   # to store target coordinates [(az, el), ...]
 stop_firing = False # track firing
 positions_text = "" # initialize variable for positions from json
+positions_version = 0 # PositionsClient.version that positions_text shows
+positions = PositionsClient(POSITIONS_URL, interval=POSITIONS_REFRESH)
+positions.start()
+status = "" # status line shown on the page
+fired = 0 # targets fired at in the current sequence
+fire_total = 0 # targets in the current sequence
+TELEMETRY_HZ = 10 # default rate of /events updates
+action_lock = threading.Lock() # run one request's actions at a time
 
 
-def web_page(status="", positions=""):
-    laser_state = "ON" if led_state.value else "OFF"
-
-    return f"""
+PAGE = Template("""
     <html>
     <head>
         <title>Laser Turret Control</title>
@@ -103,7 +117,7 @@ def web_page(status="", positions=""):
         <form method="POST">
             <button class="led" name="led" value="toggle">Toggle Laser</button>
         </form>
-        <p>Laser State: <b>{laser_state}</b></p>
+        <p>Laser State: <b id="laser">{laser_state}</b></p>
 
         <h2>JSON Control</h2>
         <form method="POST">
@@ -113,36 +127,62 @@ def web_page(status="", positions=""):
         </form>
 
         <h2>Status</h2>
-        <pre>{status}</pre>
+        <p>Azimuth: <b id="az">{az:.1f}</b>° &nbsp;
+           Elevation: <b id="el">{el:.1f}</b>° &nbsp;
+           Fired: <b id="fired">{fired}/{fire_total}</b></p>
+        <pre id="status">{status}</pre>
 
         <h2>positions.json</h2>
-        <pre>{positions}</pre>
-
+        <pre id="positions">{positions}</pre>
+
+        <script>
+            // send button presses without reloading; /events keeps the page current
+            document.querySelectorAll("form").forEach(f => f.addEventListener("submit", e => {{
+                e.preventDefault();
+                const body = new URLSearchParams(new FormData(f, e.submitter));
+                fetch("/", {{method: "POST", headers: {{"X-Live": "1"}}, body}});
+            }}));
+            const $ = id => document.getElementById(id);
+            const events = new EventSource("/events");
+            events.onmessage = e => {{
+                const t = JSON.parse(e.data);
+                $("az").textContent = t.az.toFixed(1);
+                $("el").textContent = t.el.toFixed(1);
+                $("laser").textContent = t.laser ? "ON" : "OFF";
+                $("fired").textContent = t.fired + "/" + t.fire_total;
+                $("status").textContent = t.status;
+            }};
+            events.addEventListener("positions", e => {{ $("positions").textContent = JSON.parse(e.data); }});
+        </script>
     </body>
     </html>
-    """.encode("utf-8")
-
-def parsePOST(msg):
-    data_dict = {}
-    idx = msg.find("\r\n\r\n")
-    if idx == -1:
-        return data_dict
-    body = msg[idx + 4:]
-    for p in body.split("&"):
-        if "=" in p:
-            k, v = p.split("=", 1)
-            data_dict[k] = v
-    return data_dict
-
-def firing_sequence(): # firing operation
-    global stop_firing
+    """)
+
+
+def page_values(status="", positions=""): # dynamic fragments of PAGE
+    return {
+        "laser_state": "ON" if shared.laser() else "OFF",
+        "az": m1.getAngle(),
+        "el": m2.getAngle(),
+        "fired": fired,
+        "fire_total": fire_total,
+        "status": status,
+        "positions": positions,
+    }
+
+
+def web_page(status="", positions=""):
+    return PAGE.render(**page_values(status, positions))
+
+def firing_sequence(targets): # firing operation, targets in visiting order
+    global stop_firing, fired, fire_total
     stop_firing = False # change state when firing
-    for az, el in loaded_targets:
+    fired, fire_total = 0, len(targets)
+    for az, el in targets:
         if stop_firing: # stop if necessary
             break
         led_off() # make sure led off
-        m1.goAngle(az)
-        m2.goAngle(el)
+        Stepper.goAngles([(m1, az), (m2, el)], mode=SLEW_MODE) # move both axes together
         m1.wait() # finish motor movements before turning laser
         m2.wait()
         if stop_firing: # second check for stop input
@@ -150,121 +190,233 @@ def firing_sequence(): # firing operation
         led_on()
         time.sleep(3)
         led_off()
+        fired += 1
 
 
-def serve_web_page():
-    global loaded_targets, stop_firing, positions_text
-
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.bind(("", 80))
-    s.listen(3)
-
-    status = ""
-
-    while True:
-        conn, _ = s.accept()
-        msg = conn.recv(4096).decode("utf-8")
-        data = parsePOST(msg)
-# call for actions based on html input
-        if "jog_az" in data: 
-            m1.rotate(float(data["jog_az"]))
-        if "jog_el" in data:
-            m2.rotate(float(data["jog_el"]))
-
-        if "move_az" in data and "set_az" in data:
-            m1.goAngle(float(data["set_az"]))
-        if "move_el" in data and "set_el" in data:
-            m2.goAngle(float(data["set_el"]))
-
-        if "set_zero" in data:
-            if data["set_zero"] == "az":
-                m1.zero()
-            elif data["set_zero"] == "el":
-                m2.zero()
-
-        if data.get("led") == "toggle":
-            if led_state.value:
-                led_off()
-            else:
-                led_on()
+def do_actions(data): # call for actions based on html input
+    if "jog_az" in data: 
+        m1.rotate(float(data["jog_az"]))
+    if "jog_el" in data:
+        m2.rotate(float(data["jog_el"]))
+
+    if "move_az" in data and "set_az" in data:
+        m1.goAngle(float(data["set_az"]))
+    if "move_el" in data and "set_el" in data:
+        m2.goAngle(float(data["set_el"]))
+
+    if "set_zero" in data:
+        if data["set_zero"] == "az":
+            m1.zero()
+        elif data["set_zero"] == "el":
+            m2.zero()
+
+    if data.get("led") == "toggle":
+        toggle_laser()
+
+    if "load_json" in data:
+        load_positions()
+
+    if "start_firing" in data:
+        start_firing()
+
 
-        if "stop" in data:
-            stop_firing = True
+def load_positions(): # solve for targets from the latest positions.json
+    global positions_text, positions_version, status
+    loaded_targets.clear() # clear old json
+    try:
+        raw = positions.get() # cached copy, refreshed in the background
+        j, targets = solve(raw, TEAM_ID)
+        if positions.version != positions_version: # only re-render when it changed
+            positions_text = json.dumps(j, indent=2)
+            positions_version = positions.version
+        loaded_targets.extend(targets) # aiming solutions, cached per document
+
+        status = f"Loaded {len(loaded_targets)} targets."
+
+    except Exception as e:
+        status = f"Error loading JSON: {e}"
+
+
+def start_firing():
+    global status
+    if not loaded_targets:
+        return
+    # reorder targets to minimize motion time from where we are now
+    m1.wait()
+    m2.wait()
+    order, traverse = plan(loaded_targets, (m1.getAngle(), m2.getAngle()),
+                           Stepper.profile, Stepper.stepsPerDegree(SLEW_MODE))
+    threading.Thread(target=firing_sequence, args=(order,), daemon=True).start()
+    status = f"Firing sequence started: {len(order)} targets, expected traverse time {traverse:.1f} s."
+
+
+def stop():
+    global stop_firing, status
+    stop_firing = True
+    Stepper.stop(decelerate=STOP_DECELERATE) # interrupts moves already running
+    led_off()
+    status = "Firing stopped."
+
+
+def toggle_laser():
+    if shared.laser():
+        led_off()
+    else:
+        led_on()
+
+
+def handle(req): # runs on the server's thread pool
+    data = req.form()
+    if "stop" in data: # handled right away, without waiting for other actions
+        stop()
+    if data.keys() - {"stop"}: # a bare STOP doesn't wait for the lock
+        with action_lock:
+            do_actions(data)
+    if req.headers.get("x-live"): # page script: new state arrives via /events
+        return 204, {}, b""
+    return PAGE.respond(req.headers, **page_values(status, positions_text))
+
+
+def state():
+    snap = shared.snapshot() # consistent view of both motors and the laser
+    return {
+        "az": Stepper.toAngle(snap.position(m1.index)),
+        "el": Stepper.toAngle(snap.position(m2.index)),
+        "az_target": Stepper.toAngle(snap.target(m1.index)),
+        "el_target": Stepper.toAngle(snap.target(m2.index)),
+        "laser": snap.laser(),
+        "fired": fired,
+        "fire_total": fire_total,
+        "status": status,
+    }
+
+
+def telemetry():
+    return json.dumps(state())
+
+
+AXES = {"az": m1, "el": m2}
+COMMANDS = {"jog", "goAngle", "zero", "laser", "load", "fire", "stop", "wait"}
+
+
+# Check a batch before running any of it, so a bad command can't leave
+# the turret half-way through a batch:
+def check_batch(commands):
+    if not isinstance(commands, list):
+        raise ValueError("commands must be a list")
+    for c in commands:
+        if not isinstance(c, dict) or c.get("cmd") not in COMMANDS:
+            raise ValueError(f"unknown command: {c!r}")
+        if c["cmd"] in ("jog", "goAngle", "zero") and c.get("axis") not in AXES:
+            raise ValueError(f"bad axis in {c!r}")
+        if c["cmd"] in ("jog", "goAngle"):
+            if not math.isfinite(float(c["deg"])): # NaN/inf parse, but can't be moved to
+                raise ValueError(f"bad angle in {c!r}")
+            if c.get("mode") not in (None, *Stepper.modes):
+                raise ValueError(f"bad drive mode in {c!r}")
+        if c["cmd"] == "laser" and not (c.get("on", "toggle") == "toggle" or isinstance(c["on"], bool)):
+            raise ValueError(f"laser on must be true, false or \"toggle\" in {c!r}")
+
+
+# Run one command.  With concurrent=False each move finishes before the
+# next command; otherwise moves on different axes overlap, and jogs or
+# goAngles on the same axis merge into that axis's current move.
+def run_command(c, concurrent):
+    cmd = c["cmd"]
+    m = AXES.get(c.get("axis"))
+    if cmd == "jog":
+        m.rotate(float(c["deg"]), mode=c.get("mode"))
+    elif cmd == "goAngle":
+        m.goAngle(float(c["deg"]), mode=c.get("mode"))
+    elif cmd == "zero":
+        m.wait()
+        m.zero()
+    elif cmd == "laser":
+        on = c.get("on", "toggle")
+        if on == "toggle":
+            toggle_laser()
+        elif on:
+            led_on()
+        else:
             led_off()
-            status = "Firing stopped."
-
-        if "load_json" in data:
-            loaded_targets.clear() # clear old json
-            try:
-                r = requests.get(POSITIONS_URL, timeout=2)
-                j = r.json() 
-                
-                # offline test for testing
-                """
-                j = {
-                    "turrets": {
-                        "1": {"r": 182.8, "theta": 5.253441048502932},
-                        "2": {"r": 182.8, "theta": 3.5081117965086026},
-                        "3": {"r": 182.8, "theta": 1.9198621771937625},
-                        "4": {"r": 182.8, "theta": 4.4505895925855405},
-                        "5": {"r": 182.8, "theta": 0.4363323129985824},
-                        "6": {"r": 182.8, "theta": 2.478367537831948},
-                        "7": {"r": 182.8, "theta": 1.6231562043547263},
-                        "8": {"r": 182.8, "theta": 5.707226654021458},
-                        "9": {"r": 182.8, "theta": 4.153883619746504},
-                        "10": {"r": 182.8, "theta": 3.3510321638291125},
-                        "11": {"r": 182.8, "theta": 4.71238898038469},
-                        "12": {"r": 182.8, "theta": 2.234021442552742},
-                        "13": {"r": 182.8, "theta": 2.9670597283903604},
-                        "14": {"r": 182.8, "theta": 0.8028514559173915},
-                        "15": {"r": 182.8, "theta": 1.239183768915974},
-                        "16": {"r": 182.8, "theta": 0.20943951023931953}, 
-                        "17": {"r": 182.8, "theta": 4.886921905584122},
-                        "18": {"r": 182.8, "theta": 3.1764992386296798},
-                        "19": {"r": 182.8, "theta": 3.9968039870670142}, # us (229)
-                        "20": {"r": 182.8, "theta": 6.2482787221397}, 
-                        "21": {"r": 182.8, "theta": 2.8099800957108703},
-                        "22": {"r": 182.8, "theta": 3.787364476827695} 
-                    },
-                    "globes": [
-                        {"r": 182.8, "theta": 3.05, "z": 162.6},
-                        {"r": 182.8, "theta": 1.047, "z": 195.6}
-                    ]
-                }
-                """
-                
-                positions_text = json.dumps(j, indent=2)
-                our_theta = math.degrees(j["turrets"][TEAM_ID]["theta"])
-
-                for tid, t in j["turrets"].items():
-                    if tid == TEAM_ID: #skip self
-                        continue
-                    diff = -(math.degrees(t["theta"]) - our_theta) % 360 # find difference between us and target angle
-                    az = round((180 - diff) / 2) # using trig, make isosceles triangle to find the angle needed to reach target
-                    loaded_targets.append((az, 0.0)) # elevation angle 0 for all turrets
-
-                for g in j["globes"]:
-                    diff = -(math.degrees(g["theta"]) - our_theta) % 360
-                    az = round((180 - diff) / 2)
-                    D = 2 * g["r"] * math.cos(math.radians(az)) # using angle from isosceles, split into two right triangles to find the direct distance to the globe
-                    el = math.degrees(math.atan(g["z"] / D)) # using a right triangle, find angle  using distance and height of globe
-                    loaded_targets.append((az, el))
-
-                status = f"Loaded {len(loaded_targets)} targets."
-
-            except Exception as e:
-                status = f"Error loading JSON: {e}"
-
-        if "start_firing" in data and loaded_targets:
-            threading.Thread(target=firing_sequence, daemon=True).start()
-            status = "Firing sequence started."
-        try:
-            conn.send(b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nConnection: close\r\n\r\n")
-            conn.sendall(web_page(status, positions_text))
-        except BrokenPipeError:
-            pass
-        finally:
-            conn.close()
+    elif cmd == "load":
+        load_positions()
+    elif cmd == "fire":
+        start_firing()
+    elif cmd == "stop":
+        stop()
+    elif cmd == "wait":
+        m1.wait()
+        m2.wait()
+    if m is not None and not concurrent:
+        m.wait()
+
+
+# POST /api with a JSON batch:
+#   {"commands": [{"cmd": "jog", "axis": "az", "deg": 1, "mode": "full"}, ...],
+#    "mode": "sequential" | "concurrent", "wait": true}
+# (or just the list of commands).  A STOP from anywhere ends the batch
+# early.  Replies with how many commands ran and the state afterwards.
+def api(req):
+    try:
+        batch = json.loads(req.body or b"[]")
+        if isinstance(batch, list):
+            batch = {"commands": batch}
+        commands = batch.get("commands", [])
+        check_batch(commands)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        body = json.dumps({"error": str(e)}, separators=(",", ":"))
+        return 400, {"Content-Type": "application/json"}, body.encode()
+    concurrent = batch.get("mode") == "concurrent"
+    if any(c["cmd"] == "stop" for c in commands): # as for the page, don't queue STOP
+        stop()
+    ran = 0
+    with action_lock:
+        aborts = shared.aborts() # a STOP after this ends the batch
+        for c in commands:
+            if shared.aborts() != aborts:
+                break
+            if c["cmd"] != "stop": # already done above
+                run_command(c, concurrent)
+            ran += 1
+        if batch.get("wait", True):
+            m1.wait()
+            m2.wait()
+    body = json.dumps({"ran": ran, "state": state()}, separators=(",", ":"))
+    return 200, {"Content-Type": "application/json"}, body.encode()
+
+
+async def events(req): # Server-Sent Events stream of turret state
+    try:
+        hz = min(max(float(req.form().get("hz", TELEMETRY_HZ)), 0.1), 50)
+    except ValueError:
+        hz = TELEMETRY_HZ
+
+    async def stream():
+        last, last_positions, idle = None, None, 0
+        while True:
+            t = telemetry()
+            if positions_text != last_positions: # large, so only sent when it changes
+                last_positions = positions_text
+                yield f"event: positions\ndata: {json.dumps(positions_text)}\n\n".encode()
+            if t != last: # only send changes
+                last, idle = t, 0
+                yield f"data: {t}\n\n".encode()
+            else:
+                idle += 1
+                if idle >= 15 * hz: # comment line keeps proxies from timing out
+                    idle = 0
+                    yield b": keep-alive\n\n"
+            await asyncio.sleep(1 / hz)
+
+    return 200, {"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}, stream()
+
+
+def serve_web_page():
+    server = HTTPServer(handle, port=80)
+    server.route("/events", events)
+    server.route("/api", api)
+    server.serve_forever()
 
 threading.Thread(target=serve_web_page, daemon=True).start()
 print("Open page at http://terrapi.local/")
@@ -0,0 +1,110 @@
+# Target ordering for the firing sequence
+#
+# Finds an order to visit (az, el) targets that keeps total motion time
+# low.  Moves go the short way round like Stepper.goAngle, and azimuth and
+# elevation move together, so a hop costs as long as its longer axis takes
+# under the acceleration profile.
+#
+# Up to EXACT_MAX targets are solved exactly (Held-Karp dynamic program);
+# larger sets use nearest-neighbour followed by 2-opt improvement.
+
+from functools import lru_cache
+
+EXACT_MAX = 12
+
+
+# Shortest signed rotation from angle a to angle b [deg], as in goAngle:
+def shortest(a, b):
+    delta = b - a
+    if delta > 180:
+        delta -= 360
+    elif delta < -180:
+        delta += 360
+    return delta
+
+
+# Motion time between every pair of points; row 0 is the start position:
+def cost_matrix(points, profile, steps_per_degree):
+    @lru_cache(maxsize=None)
+    def move_time(steps):
+        return profile.duration(steps)
+
+    def hop(p, q):
+        steps = max(int(steps_per_degree * abs(shortest(p[0], q[0]))),
+                    int(steps_per_degree * abs(shortest(p[1], q[1]))))
+        return move_time(steps)
+
+    return [[hop(p, q) for q in points] for p in points]
+
+
+# Total time of visiting route (indices into points, start excluded):
+def route_time(route, cost):
+    t, prev = 0.0, 0
+    for i in route:
+        t += cost[prev][i]
+        prev = i
+    return t
+
+
+def held_karp(cost, n):
+    full = (1 << n) - 1
+    # best[mask][j]: time to visit the set mask, ending at target j
+    best = [[float("inf")] * n for _ in range(full + 1)]
+    parent = [[-1] * n for _ in range(full + 1)]
+    for j in range(n):
+        best[1 << j][j] = cost[0][j + 1]
+    for mask in range(1, full + 1):
+        row = best[mask]
+        for j in range(n):
+            t = row[j]
+            if t == float("inf"):
+                continue
+            for k in range(n):
+                if mask & (1 << k):
+                    continue
+                nxt = mask | (1 << k)
+                tk = t + cost[j + 1][k + 1]
+                if tk < best[nxt][k]:
+                    best[nxt][k] = tk
+                    parent[nxt][k] = j
+    j = min(range(n), key=lambda j: best[full][j])
+    route, mask = [], full
+    while j != -1:
+        route.append(j + 1)
+        j, mask = parent[mask][j], mask & ~(1 << j)
+    return route[::-1]
+
+
+def nearest_two_opt(cost, n):
+    route, left, prev = [], set(range(1, n + 1)), 0
+    while left:
+        nxt = min(left, key=lambda k: cost[prev][k])
+        route.append(nxt)
+        left.remove(nxt)
+        prev = nxt
+    best = route_time(route, cost)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                cand = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                t = route_time(cand, cost)
+                if t < best - 1e-9:
+                    route, best, improved = cand, t, True
+    return route
+
+
+# Order targets [(az, el), ...] starting from start = (az, el).  Returns
+# (ordered targets, expected total motion time [s]).
+def plan(targets, start, profile, steps_per_degree):
+    n = len(targets)
+    if n == 0:
+        return [], 0.0
+    points = [start] + list(targets)
+    cost = cost_matrix(points, profile, steps_per_degree)
+    if n <= EXACT_MAX:
+        route = held_karp(cost, n)
+    else:
+        route = nearest_two_opt(cost, n)
+    return [points[i] for i in route], route_time(route, cost)
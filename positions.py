@@ -0,0 +1,80 @@
+# positions.json client
+#
+# Keeps one pooled HTTP session to the positions server and revalidates
+# the document with conditional GETs (If-None-Match / If-Modified-Since),
+# so an unchanged document costs a 304 with no body.  A background thread
+# refreshes it every `interval` seconds, so callers get the cached copy
+# immediately instead of waiting on the network.
+#
+#   positions = PositionsClient(URL)
+#   positions.start()
+#   raw = positions.get()     # latest document as bytes
+
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PositionsClient:
+
+    def __init__(self, url, interval=5.0, timeout=2):
+        self.url = url
+        self.interval = interval     # background refresh period [s]
+        self.timeout = timeout     # per-request timeout [s]
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.raw = None     # latest document body
+        self.version = 0     # bumped every time the content changes
+        self.etag = None
+        self.modified = None
+        self.error = None     # last fetch error, if the last fetch failed
+        self.lock = threading.Lock()
+        self.thread = None
+
+    # Revalidate the document now.  Returns True if the content changed.
+    def fetch(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.modified:
+            headers["If-Modified-Since"] = self.modified
+        with self.lock:
+            try:
+                r = self.session.get(self.url, headers=headers, timeout=self.timeout)
+                if r.status_code == 304:
+                    self.error = None
+                    return False
+                r.raise_for_status()
+            except requests.RequestException as e:
+                self.error = e
+                raise
+            self.error = None
+            self.etag = r.headers.get("ETag")
+            self.modified = r.headers.get("Last-Modified")
+            if r.content == self.raw:
+                return False
+            self.raw = r.content
+            self.version += 1
+            return True
+
+    # Latest document; only goes to the network if nothing is cached yet.
+    def get(self):
+        if self.raw is None:
+            self.fetch()
+        return self.raw
+
+    def __run(self):
+        while True:
+            try:
+                self.fetch()
+            except requests.RequestException:
+                pass     # kept in self.error; try again next time
+            time.sleep(self.interval)
+
+    # Start refreshing in the background:
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.__run, daemon=True)
+            self.thread.start()
@@ -0,0 +1,91 @@
+# Local stand-in for the competition positions server
+#
+# Serves positions.json with ETag/Last-Modified and answers conditional
+# GETs with 304, like the real server, for testing page.py and
+# positions.py off the network:
+#
+#   python positions_server.py [port] [file]
+#
+# With a file argument the document is re-read whenever the file changes;
+# otherwise a built-in sample layout is served.
+
+import sys
+import json
+import time
+import hashlib
+import os
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE = {
+    "turrets": {
+        "1": {"r": 182.8, "theta": 5.253441048502932},
+        "2": {"r": 182.8, "theta": 3.5081117965086026},
+        "3": {"r": 182.8, "theta": 1.9198621771937625},
+        "4": {"r": 182.8, "theta": 4.4505895925855405},
+        "5": {"r": 182.8, "theta": 0.4363323129985824},
+        "6": {"r": 182.8, "theta": 2.478367537831948},
+        "7": {"r": 182.8, "theta": 1.6231562043547263},
+        "8": {"r": 182.8, "theta": 5.707226654021458},
+        "9": {"r": 182.8, "theta": 4.153883619746504},
+        "10": {"r": 182.8, "theta": 3.3510321638291125},
+        "11": {"r": 182.8, "theta": 4.71238898038469},
+        "12": {"r": 182.8, "theta": 2.234021442552742},
+        "13": {"r": 182.8, "theta": 2.9670597283903604},
+        "14": {"r": 182.8, "theta": 0.8028514559173915},
+        "15": {"r": 182.8, "theta": 1.239183768915974},
+        "16": {"r": 182.8, "theta": 0.20943951023931953},
+        "17": {"r": 182.8, "theta": 4.886921905584122},
+        "18": {"r": 182.8, "theta": 3.1764992386296798},
+        "19": {"r": 182.8, "theta": 3.9968039870670142},
+        "20": {"r": 182.8, "theta": 6.2482787221397},
+        "21": {"r": 182.8, "theta": 2.8099800957108703},
+        "22": {"r": 182.8, "theta": 3.787364476827695}
+    },
+    "globes": [
+        {"r": 182.8, "theta": 3.05, "z": 162.6},
+        {"r": 182.8, "theta": 1.047, "z": 195.6}
+    ]
+}
+
+path = sys.argv[2] if len(sys.argv) > 2 else None
+document = [json.dumps(SAMPLE).encode(), time.time()]     # body, modified time
+
+
+def current():
+    if path is not None:
+        mtime = os.path.getmtime(path)
+        if mtime != document[1]:
+            with open(path, "rb") as f:
+                document[:] = [f.read(), mtime]
+    return document
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"     # keep-alive, so client pooling is exercised
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/positions.json":
+            self.send_error(404)
+            return
+        body, mtime = current()
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(mtime, usegmt=True))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    print(f"Serving http://localhost:{port}/positions.json")
+    ThreadingHTTPServer(("", port), Handler).serve_forever()
@@ -0,0 +1,52 @@
+# Acceleration profiles for stepper moves
+#
+# A profile turns a move of n steps into a schedule of n per-step delays
+# [us].  Schedules are built once per (profile, n) and cached as arrays,
+# so repeated moves of the same length cost a dictionary lookup.
+#
+#   constant  - every step at start_delay (the old fixed Stepper.delay)
+#   trapezoid - constant acceleration from start_delay up to min_delay,
+#               cruise, then the mirror-image deceleration
+#   scurve    - same speeds, but the speed follows a smoothstep curve over
+#               the ramp so acceleration builds up and dies away gradually
+
+import math
+from array import array
+from functools import lru_cache
+
+
+@lru_cache(maxsize=256)
+def schedule(kind, n, start_delay, min_delay, accel):
+    if kind == "constant" or n == 0 or start_delay <= min_delay:
+        return array('d', [start_delay] * n)
+    v0 = 1e6 / start_delay     # speed we can start from [steps/s]
+    vmax = 1e6 / min_delay     # top speed [steps/s]
+    ramp = (vmax**2 - v0**2) / (2 * accel)     # steps to reach vmax
+    delays = array('d', bytes(8 * n))
+    for k in range((n + 1) // 2):     # accelerate over the first half...
+        if kind == "trapezoid":
+            v = min(vmax, math.sqrt(v0**2 + 2 * accel * k))
+        elif kind == "scurve":
+            x = min(1.0, k / ramp)
+            v = v0 + (vmax - v0) * x * x * (3 - 2 * x)
+        else:
+            raise ValueError(f"unknown profile: {kind}")
+        delays[k] = delays[n - 1 - k] = 1e6 / v     # ...and mirror it
+    return delays
+
+
+class Profile:
+
+    def __init__(self, kind="trapezoid", start_delay=1200, min_delay=900, accel=2000):
+        self.kind = kind
+        self.start_delay = start_delay     # delay for a step from rest [us]
+        self.min_delay = min_delay     # delay at top speed [us]
+        self.accel = accel     # [steps/s^2]
+
+    # Per-step delays [us] for a move of n steps:
+    def delays(self, n):
+        return schedule(self.kind, n, self.start_delay, self.min_delay, self.accel)
+
+    # Total time for a move of n steps [s]:
+    def duration(self, n):
+        return sum(self.delays(n)) / 1e6
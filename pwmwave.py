@@ -0,0 +1,61 @@
+# Frame-rate limited PWM wave animation
+#
+# Renders a travelling sin^2 wave across a row of PWM channels at a fixed
+# frame rate.  The phase offsets for both directions are worked out once;
+# each frame computes every channel's duty in one pass, quantizes it, and
+# only calls ChangeDutyCycle on channels whose duty actually changed.
+# flip() can be called from a GPIO callback: the direction is read once at
+# the start of each frame, so a flip takes effect on the next frame.
+#
+#   wave = Wave(pwms, freq=0.2, fps=50)
+#   wave.run()     # until interrupted
+
+import math
+import time
+
+
+class Wave:
+
+    def __init__(self, pwms, freq=0.2, fps=50, spacing=math.pi / 11, resolution=1.0):
+        self.pwms = pwms
+        self.freq = freq     # wave frequency [Hz]
+        self.fps = fps     # frames per second
+        self.resolution = resolution     # duty cycle step [%]
+        self.direction = 1     # +1 or -1
+        self.phases = {d: [d * i * spacing for i in range(len(pwms))] for d in (1, -1)}
+        self.duty = [None] * len(pwms)     # last duty cycle sent to each channel [%]
+        self.frames = 0
+        self.updates = 0     # ChangeDutyCycle calls
+
+    def flip(self):
+        self.direction = -self.direction
+
+    # Quantized duty cycles [%] of all channels at time t [s]:
+    def levels(self, t):
+        w = 2 * math.pi * self.freq * t
+        q = self.resolution
+        sin = math.sin
+        return [round(100 * sin(w - phi) ** 2 / q) * q for phi in self.phases[self.direction]]
+
+    def render(self, t):
+        duty = self.duty
+        for i, d in enumerate(self.levels(t)):
+            if d != duty[i]:
+                self.pwms[i].ChangeDutyCycle(d)
+                duty[i] = d
+                self.updates += 1
+        self.frames += 1
+
+    # Render frames on a fixed clock, for duration [s] or forever.  Frames
+    # that are already late are dropped rather than rendered back to back.
+    def run(self, duration=None):
+        period = 1 / self.fps
+        start = deadline = time.monotonic()
+        while duration is None or deadline - start < duration:
+            self.render(deadline - start)
+            deadline += period
+            wait = deadline - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            else:
+                deadline -= (wait // period) * period     # skip missed frames
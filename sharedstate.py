@@ -0,0 +1,122 @@
+# Shared-memory state block for the turret
+#
+# All motor and laser state lives in one array of doubles, allocated once
+# before the motion worker is forked:
+#
+#   [0]            sequence counter (seqlock)
+#   [1]            laser state (0/1)
+#   [2]            abort request counter
+#   [3]            abort mode of the last request (0 halt, 1 decelerate)
+#   [4 + 4*i]      motor i position [steps]
+#   [5 + 4*i]      motor i target [steps]
+#   [6 + 4*i]      motor i commands issued
+#   [7 + 4*i]      motor i coil outputs (its 4 shift register bits)
+#
+# The motion worker is the only writer of the motor fields other than the
+# issued counts.  It brackets each update with begin()/end(), which make the
+# counter odd while a write is in progress.  Readers copy the block and
+# retry if the counter was odd or changed, so they get a consistent
+# snapshot without taking a lock and without slowing the writer down.
+# Readers yield between retries and give up after a bounded number, so a
+# writer that died mid-update can't hang them.
+# The laser flag, abort fields and issued counts are written from the web
+# side and are read as single words.
+
+import time
+import multiprocessing
+
+SEQ = 0
+LASER = 1
+ABORT = 2
+ABORT_MODE = 3
+MOTORS = 4
+STRIDE = 4     # words per motor
+
+
+# A consistent copy of the block, read with the same accessors:
+class Snapshot:
+
+    def __init__(self, data):
+        self.data = data
+
+    def laser(self):
+        return int(self.data[LASER])
+
+    def position(self, i):
+        return self.data[MOTORS + STRIDE * i]
+
+    def target(self, i):
+        return self.data[MOTORS + STRIDE * i + 1]
+
+
+class StateBlock:
+
+    def __init__(self, max_motors):
+        self.max_motors = max_motors
+        self.buf = multiprocessing.RawArray('d', MOTORS + STRIDE * max_motors)
+
+    # --- writer side (motion worker only) ---
+
+    def begin(self):
+        self.buf[SEQ] += 1
+
+    def end(self):
+        self.buf[SEQ] += 1
+
+    def set_position(self, i, value):
+        self.buf[MOTORS + STRIDE * i] = value
+
+    def set_target(self, i, value):
+        self.buf[MOTORS + STRIDE * i + 1] = value
+
+    def set_coils(self, i, value):
+        self.buf[MOTORS + STRIDE * i + 3] = value
+
+    def set_laser(self, on):
+        self.buf[LASER] = 1 if on else 0
+
+    # Count a command sent to motor i's queue (web side):
+    def issue(self, i):
+        self.buf[MOTORS + STRIDE * i + 2] += 1
+
+    # Ask the motion worker to abort every move (web side):
+    def request_abort(self, decelerate=False):
+        self.buf[ABORT_MODE] = 1 if decelerate else 0
+        self.buf[ABORT] += 1
+
+    # --- reader side ---
+
+    # Consistent copy of the whole block, as a Snapshot (the latest copy,
+    # possibly torn, if no write finishes within `retries` tries):
+    def snapshot(self, retries=1000):
+        buf = self.buf
+        for _ in range(retries):
+            seq = buf[SEQ]
+            if seq % 2 == 0:     # else a write is in progress
+                data = buf[:]
+                if buf[SEQ] == seq:
+                    return Snapshot(data)
+            time.sleep(0)     # let the writer finish
+        return Snapshot(buf[:])
+
+    # Single fields (one word each, so always consistent on their own):
+    def laser(self):
+        return int(self.buf[LASER])
+
+    def aborts(self):
+        return int(self.buf[ABORT])
+
+    def abort_mode(self):
+        return int(self.buf[ABORT_MODE])
+
+    def position(self, i):
+        return self.buf[MOTORS + STRIDE * i]
+
+    def target(self, i):
+        return self.buf[MOTORS + STRIDE * i + 1]
+
+    def issued(self, i):
+        return int(self.buf[MOTORS + STRIDE * i + 2])
+
+    def coils(self, i):
+        return int(self.buf[MOTORS + STRIDE * i + 3])
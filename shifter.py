@@ -1,7 +1,8 @@
 # Shift register class
 
-from RPi import GPIO
+from backend import GPIO
 from time import sleep
+from fifocache import FIFOCache
 
 GPIO.setmode(GPIO.BCM)
 
@@ -14,19 +15,44 @@ class Shifter():
         GPIO.setup(self.dataPin, GPIO.OUT)
         GPIO.setup(self.latchPin, GPIO.OUT)
         GPIO.setup(self.clockPin, GPIO.OUT)
+        self.table = self.buildTable()
+        self.chainTable = [(c[:-2], v[:-2]) for c, v in self.table]   # no latch
 
     def ping(self, p):  # ping the clock or latch pin
         GPIO.output(p,1)
         sleep(0)
         GPIO.output(p,0)
 
+    # Precompute the pin transitions that shift out each possible byte.
+    # Entry [byte] is a (channels, values) pair played with a single
+    # GPIO.output call.  The first data bit is always written (the pin may
+    # have been driven by another process), after that a data write is only
+    # emitted when the bit differs from the previous one.
+    def buildTable(self):
+        table = []
+        for b in range(256):
+            chans, vals = [], []
+            d = None
+            for i in range(8):      # same bit order as shiftWord
+                bit = (b >> i) & 1
+                if bit != d:
+                    chans.append(self.dataPin)
+                    vals.append(bit)
+                    d = bit
+                chans += [self.clockPin, self.clockPin]
+                vals += [1, 0]
+            chans += [self.latchPin, self.latchPin]
+            vals += [1, 0]
+            table.append((tuple(chans), tuple(vals)))
+        return table
+
     # Shift all bits in an arbitrary-length word, allowing
     # multiple 8-bit shift registers to be chained (with overflow
     # of SR_n tied to input of SR_n+1):
     def shiftWord(self, dataword, num_bits):
         for i in range((num_bits+1) % 8):  # Load bits short of a byte with 0
             # self.dataPin.value(0)  # MicroPython for ESP32
-            GPIO.output(self.dataPin, 0) 
+            GPIO.output(self.dataPin, 0)
             self.ping(self.clockPin)
         for i in range(num_bits):          # Send the word
             # self.dataPin.value(dataword & (1<<i))  # MicroPython for ESP32
@@ -36,7 +62,128 @@ class Shifter():
 
     # Shift all bits in a single byte:
     def shiftByte(self, databyte):
-        self.shiftWord(databyte, 8)
+        chans, vals = self.table[databyte & 0xFF]
+        GPIO.output(chans, vals)
+
+    # Play a buffer of frames (bytes, bytearray, array('B') or a list of
+    # ints), latching each one and waiting interval [s] between frames:
+    def shiftFrames(self, buffer, interval=0):
+        table = self.table
+        output = GPIO.output
+        for b in buffer:
+            chans, vals = table[b & 0xFF]
+            output(chans, vals)
+            if interval:
+                sleep(interval)
+
+    # Shift one byte per chained register, data[0] for the register
+    # nearest the Pi, and latch them all at once, in one GPIO.output call:
+    def shiftBytes(self, data):
+        chans, vals = [], []
+        for b in reversed(data):    # far register first
+            c, v = self.chainTable[b & 0xFF]
+            chans += c
+            vals += v
+        chans += [self.latchPin, self.latchPin]
+        vals += [1, 0]
+        GPIO.output(chans, vals)
+
+
+# Shifter for K register chains side by side: one data pin per chain
+# (lane), with clock and latch shared.  Every clock pulse moves one bit on
+# every lane at once, so a frame needs 1/K of the clock pulses of a single
+# chain.  Devices are numbered across the lanes: lane 0 holds devices
+# 0..n-1 (nearest the Pi first), lane 1 the next n, and so on, with
+# n = ceil(devices / K).  Drop-in for Shifter under a Chain.
+#
+# Transposing a frame into lanes costs more Python than a table lookup,
+# so the pin sequence of recent frames is kept (motor frames repeat a lot).
+class LaneShifter():
+
+    cache_size = 1024     # frames
+
+    def __init__(self, datas, clock, latch):
+        self.dataPins = list(datas)
+        self.latchPin = latch
+        self.clockPin = clock
+        for p in self.dataPins:
+            GPIO.setup(p, GPIO.OUT)
+        GPIO.setup(self.latchPin, GPIO.OUT)
+        GPIO.setup(self.clockPin, GPIO.OUT)
+        self.cache = FIFOCache(self.cache_size)     # frame bytes -> (channels, values)
+
+    # Shift one byte per device across all lanes and latch them together,
+    # in one GPIO.output call.  A data pin is only written when its bit
+    # changes from the previous clock.
+    def shiftBytes(self, data):
+        key = bytes(data)
+        GPIO.output(*self.cache.lookup(key, lambda: self.build(key)))
+
+    # (channels, values) that shift out one frame:
+    def build(self, data):
+        k = len(self.dataPins)
+        n = (len(data) + k - 1) // k     # devices per lane
+        lanes = [data[j * n:(j + 1) * n] for j in range(k)]
+        pins = self.dataPins
+        clock = self.clockPin
+        chans, vals = [], []
+        last = [None] * k
+        for p in range(n - 1, -1, -1):      # far devices first
+            column = [lane[p] if p < len(lane) else 0 for lane in lanes]   # short lanes: pad, it falls off the end
+            for i in range(8):      # same bit order as shiftByte
+                for j in range(k):
+                    bit = (column[j] >> i) & 1
+                    if bit != last[j]:
+                        chans.append(pins[j])
+                        vals.append(bit)
+                        last[j] = bit
+                chans += [clock, clock]
+                vals += [1, 0]
+        chans += [self.latchPin, self.latchPin]
+        vals += [1, 0]
+        return tuple(chans), tuple(vals)
+
+    def shiftByte(self, databyte):
+        self.shiftBytes([databyte & 0xFF])
+
+
+# Framebuffer for a chain of cascaded 74HC595s driven by one Shifter
+# (QH' of each device feeding SER of the next).  The image holds one byte
+# per device, [0] nearest the Pi.  Users update bit fields of a device;
+# flush() shifts the whole chain, exactly one byte per device, and only
+# when a field actually changed since the last flush.
+class Chain():
+
+    def __init__(self, shifter, devices=1):
+        self.shifter = shifter
+        self.devices = devices
+        self.image = bytearray(devices)
+        self.dirty = True     # hardware state unknown until the first flush
+
+    # Number of devices needed for num_bits outputs:
+    @staticmethod
+    def size(num_bits):
+        return max(1, (num_bits + 7) // 8)
+
+    def get(self, device, lsb, width):
+        return (self.image[device] >> lsb) & ((1 << width) - 1)
+
+    def set(self, device, lsb, width, value):
+        if lsb + width > 8:
+            raise ValueError("bit field crosses a device boundary")
+        mask = ((1 << width) - 1) << lsb
+        b = (self.image[device] & ~mask) | ((value << lsb) & mask)
+        if b != self.image[device]:
+            self.image[device] = b
+            self.dirty = True
+
+    # Shift the image out if it changed.  Returns True if it did.
+    def flush(self):
+        if not self.dirty:
+            return False
+        self.shifter.shiftBytes(self.image)
+        self.dirty = False
+        return True
 
 
 # Example:
@@ -46,3 +193,14 @@ class Shifter():
 # for i in range(256):
 #     s.shiftByte(i)
 #     sleep(0.1)
+#
+# or, as a single call:
+# s.shiftFrames(range(256), 0.1)
+#
+# Three chained registers, setting the top nibble of the last one:
+# c = Chain(s, devices=3)
+# c.set(2, 4, 4, 0b1001)
+# c.flush()
+#
+# Eight registers as four 2-register lanes on data pins 16, 5, 6, 13:
+# c = Chain(LaneShifter([16, 5, 6, 13], clock=20, latch=21), devices=8)
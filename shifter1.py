@@ -1,7 +1,8 @@
 import threading
-import RPi.GPIO as GPIO
+from backend import GPIO
 import time
 import random
+from array import array
 
 GPIO.setmode(GPIO.BCM)
 
@@ -25,36 +26,157 @@ class Shifter:
             self.__ping(self.clockPin)
         self.__ping(self.latchPin)
 
+    # Shift one byte per chained register, data[0] for the register
+    # nearest the Pi, and latch them all at once:
+    def shiftBytes(self, data):
+        for b in reversed(data):
+            for i in range(8):
+                GPIO.output(self.serialPin, b & (1 << i))
+                self.__ping(self.clockPin)
+        self.__ping(self.latchPin)
 
-class Bug:
-    def __init__(self, timestep=0.1, x=3, isWrapOn=False):
-        self.timestep = timestep
-        self.x = x
-        self.isWrapOn = isWrapOn
-        self.__shifter = Shifter(23, 25, 24)
-        self.running = False
+
+# Any number of bugs rendered by one thread.  Bug state lives in flat
+# arrays, one slot per bug; every tick draws one random bit per bug in a
+# single getrandbits() call, moves the bugs that are due, ORs them all into
+# one frame and shifts it once (and only if it changed).  The frame spans
+# `registers` chained shift registers, 8 positions each.  Each bug moves
+# every `every[i]` ticks, so bugs can run at different speeds.
+class Swarm:
+    __default = None
+
+    def __init__(self, shifter, registers=1, tick=.1/3):
+        self.shifter = shifter
+        self.registers = registers
+        self.width = 8 * registers     # positions
+        self.tick = tick     # render period [s]
+        self.x = array('H')     # position
+        self.wrap = array('B')     # wrap around the ends
+        self.active = array('B')
+        self.every = array('H')     # ticks per move
+        self.count = array('H')     # ticks until the next move
+        self.frame = 0
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
         self.thread = None
 
-    def __run(self):
-        while self.running:
-            pattern = 1 << self.x
-            self.__shifter.shiftByte(pattern)
-            step = random.choice([-1, 1])
-            xnew = self.x + step
-            if self.isWrapOn:
-                self.x = xnew % 8
-            else:
-                if 0 <= xnew <= 7:
-                    self.x = xnew
-            time.sleep(self.timestep)
+    # Shared swarm on the original bug pins:
+    @staticmethod
+    def default():
+        if Swarm.__default is None:
+            Swarm.__default = Swarm(Shifter(23, 25, 24))
+        return Swarm.__default
 
-    def start(self):
-        if not self.running:
-            self.running = True
+    def add(self, x=3, timestep=0.1, isWrapOn=False):
+        with self.lock:
+            self.x.append(x)
+            self.wrap.append(isWrapOn)
+            self.active.append(0)
+            self.every.append(self.ticks(timestep))
+            self.count.append(1)
+            return len(self.x) - 1
+
+    def ticks(self, timestep):
+        return max(1, round(timestep / self.tick))
+
+    def start(self, i):
+        self.active[i] = 1
+        self.wake.set()
+        if self.thread is None:
             self.thread = threading.Thread(target=self.__run)
             self.thread.daemon = True
             self.thread.start()
 
+    # Stop bug i; when it was the last one, blank the display right away
+    # instead of on the next tick, which may never come if we're exiting:
+    def stop(self, i):
+        with self.lock:
+            self.active[i] = 0
+            if not any(self.active) and self.frame:
+                self.shifter.shiftBytes(bytes(self.registers))
+                self.frame = 0
+
+    def __step(self):
+        n = len(self.x)
+        x, wrap, active, every, count = self.x, self.wrap, self.active, self.every, self.count
+        width = self.width
+        bits = random.getrandbits(8 * ((n + 7) // 8)).to_bytes((n + 7) // 8, "little")
+        frame = 0
+        for i in range(n):
+            if not active[i]:
+                continue
+            count[i] -= 1
+            if count[i] == 0:
+                count[i] = every[i]
+                xnew = x[i] + (1 if bits[i >> 3] >> (i & 7) & 1 else -1)
+                if wrap[i]:
+                    x[i] = xnew % width
+                elif 0 <= xnew < width:
+                    x[i] = xnew
+            frame |= 1 << x[i]
+        return frame
+
+    def __run(self):
+        deadline = time.monotonic()
+        while True:
+            with self.lock:     # shift under the lock too, so stop() can't be undone
+                frame = self.__step()
+                if not any(self.active):     # blank, then sleep until a bug starts
+                    frame = 0
+                    self.wake.clear()
+                if frame != self.frame:
+                    self.shifter.shiftBytes(frame.to_bytes(self.registers, "little"))
+                    self.frame = frame
+            if not any(self.active):
+                self.wake.wait()
+                deadline = time.monotonic()
+                continue
+            deadline += self.tick
+            wait = deadline - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            else:
+                deadline = time.monotonic()
+
+
+# One bug in a Swarm (the shared default one unless given)
+class Bug:
+    def __init__(self, timestep=0.1, x=3, isWrapOn=False, swarm=None):
+        self.swarm = swarm or Swarm.default()
+        self.__timestep = timestep
+        self.i = self.swarm.add(x, timestep, isWrapOn)
+
+    @property
+    def x(self):
+        return self.swarm.x[self.i]
+
+    @x.setter
+    def x(self, value):
+        self.swarm.x[self.i] = value
+
+    @property
+    def isWrapOn(self):
+        return bool(self.swarm.wrap[self.i])
+
+    @isWrapOn.setter
+    def isWrapOn(self, value):
+        self.swarm.wrap[self.i] = bool(value)
+
+    @property
+    def timestep(self):
+        return self.__timestep
+
+    @timestep.setter
+    def timestep(self, value):
+        self.__timestep = value
+        self.swarm.every[self.i] = self.swarm.ticks(value)
+
+    @property
+    def running(self):
+        return bool(self.swarm.active[self.i])
+
+    def start(self):
+        self.swarm.start(self.i)
+
     def stop(self):
-        self.running = False
-        self.__shifter.shiftByte(0)
+        self.swarm.stop(self.i)
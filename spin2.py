@@ -12,7 +12,6 @@
 # using any additional GPIO pins.
 
 from shifter import Shifter
-import time
 
 s = Shifter(data=16,clock=20,latch=21)   # Set up shifter
 
@@ -32,11 +31,10 @@ delay = 1200/1e6  # delay between steps [us]
 # Make a full rotation of the output shaft:
 def loop(dir): # dir = rotation direction (1=cww, -1=cw)
     global pos
-    for i in range(4096): # 4096 steps/rev
-        pos += dir
-        pos %= 8 
-        s.shiftByte(cycle[pos]<<0)
-        time.sleep(delay)
+    # build all 4096 frames up front and play them out in one call
+    frames = bytes(cycle[(pos + dir*(i+1)) % 8]<<0 for i in range(4096)) # 4096 steps/rev
+    pos = (pos + dir*4096) % 8
+    s.shiftFrames(frames, delay)
 
 try:
     loop(1)
@@ -0,0 +1,68 @@
+# Deadline-based step clock
+#
+# Instead of sleeping a fixed delay after each step (which lets the time
+# spent stepping and shifting pile up), every step gets an absolute target
+# time.  The clock sleeps until shortly before the deadline and then spins
+# for the last stretch, which time.sleep() cannot hit reliably.
+#
+# It also keeps a histogram of how late each step fired.  The results live
+# in shared memory, so a timer made before the motion worker is forked can
+# be read from the parent after a move.
+
+import time
+import multiprocessing
+
+
+class StepTimer:
+
+    spin = 300e-6     # spin instead of sleeping for the last 300 us [s]
+    bin_width = 10     # histogram bin width [us]
+    num_bins = 100     # last bin also counts anything later
+
+    def __init__(self):
+        self.late = multiprocessing.RawArray('L', StepTimer.num_bins)    # lateness histogram
+        self.totals = multiprocessing.RawArray('d', 3)    # steps, elapsed [s], max lateness [us]
+        self.deadline = time.perf_counter()
+        self.start = self.deadline
+
+    # Start a new timeline at the current time:
+    def reset(self):
+        self.deadline = time.perf_counter()
+        self.start = self.deadline
+        for i in range(StepTimer.num_bins):
+            self.late[i] = 0
+        self.totals[:] = [0, 0, 0]
+
+    # Wait until delay [us] past the previous deadline, then record how
+    # late we actually are:
+    def wait(self, delay):
+        self.deadline += delay / 1e6
+        now = time.perf_counter()
+        if self.deadline - now > StepTimer.spin:
+            time.sleep(self.deadline - now - StepTimer.spin)
+        while True:
+            now = time.perf_counter()
+            if now >= self.deadline:
+                break
+        late = (now - self.deadline) * 1e6
+        self.late[min(int(late // StepTimer.bin_width), StepTimer.num_bins - 1)] += 1
+        totals = self.totals
+        totals[0] += 1
+        totals[1] = now - self.start
+        if late > totals[2]:
+            totals[2] = late
+        # if we fell far behind (e.g. the process was descheduled) don't try
+        # to catch up with a burst of steps
+        if late > 10 * delay:
+            self.deadline = now
+
+    # Summary of the last timeline:
+    def stats(self):
+        steps, elapsed, max_late = self.totals
+        return {
+            "steps": int(steps),
+            "elapsed": elapsed,     # [s]
+            "rate": steps / elapsed if elapsed > 0 else 0.0,     # [steps/s]
+            "max_late": max_late,     # [us]
+            "histogram": list(self.late),     # step counts per bin_width us of lateness
+        }
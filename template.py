@@ -0,0 +1,59 @@
+# Precompiled HTML templates
+#
+# A template is written in str.format syntax ({name}, {0}, {name:.1f},
+# with {{ }} for literal braces).  The text is split once into pre-encoded
+# static chunks and slots, so rendering only formats and encodes the
+# dynamic fragments and joins bytes.
+#
+# respond() adds the HTTP side: an ETag computed from the slot values
+# (no rendering needed to answer If-None-Match with 304), optional gzip,
+# and a small cache of recent renders keyed by ETag.
+
+import gzip
+import hashlib
+from string import Formatter
+from fifocache import FIFOCache
+
+CACHE_SIZE = 8
+
+
+class Template:
+
+    def __init__(self, text, content_type="text/html; charset=utf-8", gzip_min=1024):
+        self.parts = []     # (static bytes, slot name or None, format spec)
+        for literal, field, spec, _ in Formatter().parse(text):
+            self.parts.append((literal.encode("utf-8"), field, spec or ""))
+        self.content_type = content_type
+        self.gzip_min = gzip_min     # compress bodies at least this long [bytes], 0 = never
+        self.tag = hashlib.md5(text.encode("utf-8")).hexdigest()[:8]
+        self.cache = FIFOCache(CACHE_SIZE)     # etag -> [body, gzipped body or None]
+
+    def render(self, *args, **kwargs):
+        out = []
+        for static, field, spec in self.parts:
+            out.append(static)
+            if field is not None:
+                value = args[int(field)] if field.isdigit() else kwargs[field]
+                out.append(format(value, spec).encode("utf-8"))
+        return b"".join(out)
+
+    def etag(self, *args, **kwargs):
+        values = repr((args, sorted(kwargs.items()))).encode("utf-8")
+        return f'"{self.tag}-{hashlib.md5(values).hexdigest()[:16]}"'
+
+    # (status, headers, body) for a request with the given (lower-case)
+    # headers, answering 304 when the client already has this render:
+    def respond(self, headers, *args, **kwargs):
+        etag = self.etag(*args, **kwargs)
+        out = {"Content-Type": self.content_type, "ETag": etag, "Cache-Control": "no-cache"}
+        if headers.get("if-none-match") == etag:
+            return 304, {"ETag": etag}, b""
+        entry = self.cache.lookup(etag, lambda: [self.render(*args, **kwargs), None])
+        body = entry[0]
+        if self.gzip_min and len(body) >= self.gzip_min and "gzip" in headers.get("accept-encoding", ""):
+            if entry[1] is None:
+                entry[1] = gzip.compress(body, 6)
+            body = entry[1]
+            out["Content-Encoding"] = "gzip"
+            out["Vary"] = "Accept-Encoding"
+        return 200, out, body